@@ -0,0 +1,28 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Benchmarks of NagData (not installed with nagdata package).
+
+generate -- generator of synthetic Nagios installations (1k, 10k, 100k, 1m
+            services)
+run      -- benchmarks of startup, update_status, lookups, save and
+            nagios_reloaded reporting JSON lines
+
+python -m benchmarks.run -s 1k,10k,100k -o results.jsonl
+"""
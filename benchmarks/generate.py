@@ -0,0 +1,425 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Generator of synthetic Nagios installation: nagios.cfg, object files (with
+templates, host and service groups, contacts), status.dat and nagios.log.
+
+Every host gets SERVICES_PER_HOST services: two of them are defined once for
+hostgroup of host's role, others are defined for host itself. Hosts are put
+into files of HOSTS_PER_FILE hosts in directories of sites.
+
+Run as python -m benchmarks.generate -s 10k /tmp/nagios-10k
+"""
+
+import os
+import random
+
+# name -> number of services
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+SERVICES_PER_HOST = 10
+HOSTS_PER_FILE = 100
+SITES = 10
+ROLES = ['web', 'db', 'mail', 'app', 'cache']
+# services defined for hostgroup of every role
+GROUP_SERVICES = ['PING', 'SSH']
+HOST_SERVICES = ['DISK /', 'DISK /var', 'LOAD', 'USERS', 'SWAP', 'PROCS',
+        'NTP', 'HTTP', 'MYSQL', 'SMTP', 'MEMCACHED', 'CPU']
+# start of generated history
+BASE_TIME = 1286790000
+
+def _define(f, obj_type, attrs):
+    f.write('define %s {\n' % obj_type)
+    for a, v in attrs:
+        f.write('\t%-32s%s\n' % (a, v))
+    f.write('\t}\n\n')
+
+def _status(f, obj_type, attrs):
+    f.write('%s {\n' % obj_type)
+    for a, v in attrs:
+        f.write('\t%s=%s\n' % (a, v))
+    f.write('\t}\n\n')
+
+def host_name(i):
+    return 'host%07d' % i
+
+def host_role(i):
+    return ROLES[i % len(ROLES)]
+
+def host_site(i):
+    return 'site%02d' % (i // HOSTS_PER_FILE % SITES)
+
+def host_services(i):
+    """
+    Return list of (service_description, defined for hostgroup) of host i
+    """
+    n = SERVICES_PER_HOST - len(GROUP_SERVICES)
+    own = [ HOST_SERVICES[(i + k) % len(HOST_SERVICES)] for k in range(n) ]
+    return [ (s, True) for s in GROUP_SERVICES ] + [ (s, False) for s in own ]
+
+class Dataset(object):
+    """
+    Generated installation in directory
+    """
+
+    def __init__(self, directory, services=1000, seed=0, log_lines=None):
+        """
+        directory -- where to put files
+        services  -- number of services (hosts get SERVICES_PER_HOST each)
+        seed      -- seed of random generator
+        log_lines -- number of records in nagios.log (number of services by
+                     default)
+        """
+        self.directory = os.path.abspath(directory)
+        self.hosts = max(1, services // SERVICES_PER_HOST)
+        self.services = self.hosts * SERVICES_PER_HOST
+        self.seed = seed
+        if log_lines is None:
+            log_lines = self.services
+        self.log_lines = log_lines
+        self.nagios_cfg = os.path.join(self.directory, 'nagios.cfg')
+        self.objects_dir = os.path.join(self.directory, 'objects')
+        self.hosts_dir = os.path.join(self.objects_dir, 'hosts')
+        self.status_file = os.path.join(self.directory, 'status.dat')
+        self.log_file = os.path.join(self.directory, 'nagios.log')
+
+    def generate(self):
+        """
+        Write all files, returns path of nagios.cfg
+        """
+        self.random = random.Random(self.seed)
+        for d in (self.directory, self.objects_dir, self.hosts_dir):
+            if not os.path.isdir(d):
+                os.makedirs(d)
+        self.write_main_config()
+        self.write_common_objects()
+        self.write_hosts()
+        self.write_status()
+        self.write_log()
+        return self.nagios_cfg
+
+    def _objects_file(self, name):
+        return os.path.join(self.objects_dir, name)
+
+    def write_main_config(self):
+        f = open(self.nagios_cfg, 'w')
+        f.write('# generated by benchmarks.generate\n')
+        f.write('log_file=%s\n' % self.log_file)
+        for name in ('commands.cfg', 'timeperiods.cfg', 'contacts.cfg',
+                'templates.cfg', 'groups.cfg'):
+            f.write('cfg_file=%s\n' % self._objects_file(name))
+        f.write('cfg_dir=%s\n' % self.hosts_dir)
+        f.write('status_file=%s\n' % self.status_file)
+        f.write('status_update_interval=10\n')
+        f.write('check_result_reaper_frequency=10\n')
+        f.write('interval_length=60\n')
+        f.close()
+
+    def write_common_objects(self):
+        f = open(self._objects_file('commands.cfg'), 'w')
+        for name, line in [
+                ('check-host-alive', '$USER1$/check_ping -H $HOSTADDRESS$ '
+                    '-w 3000.0,80% -c 5000.0,100% -p 5'),
+                ('check_ping', '$USER1$/check_ping -H $HOSTADDRESS$ '
+                    '-w $ARG1$ -c $ARG2$ -p 5'),
+                ('check_ssh', '$USER1$/check_ssh $ARG1$ $HOSTADDRESS$'),
+                ('check_nrpe', '$USER1$/check_nrpe -H $HOSTADDRESS$ '
+                    '-c $ARG1$'),
+                ('check_http', '$USER1$/check_http -I $HOSTADDRESS$ $ARG1$'),
+                ('notify-host-by-email', '/usr/bin/printf "%b" '
+                    '"$HOSTNAME$ is $HOSTSTATE$" | /usr/bin/mail $CONTACTEMAIL$'),
+                ('notify-service-by-email', '/usr/bin/printf "%b" '
+                    '"$SERVICEDESC$ is $SERVICESTATE$" | '
+                    '/usr/bin/mail $CONTACTEMAIL$')]:
+            _define(f, 'command', [('command_name', name),
+                ('command_line', line)])
+        f.close()
+
+        f = open(self._objects_file('timeperiods.cfg'), 'w')
+        _define(f, 'timeperiod', [('timeperiod_name', '24x7'),
+            ('alias', '24 Hours A Day, 7 Days A Week')] +
+            [ (d, '00:00-24:00') for d in ('monday', 'tuesday', 'wednesday',
+                'thursday', 'friday', 'saturday', 'sunday') ])
+        _define(f, 'timeperiod', [('timeperiod_name', 'workhours'),
+            ('alias', 'Normal Work Hours')] +
+            [ (d, '09:00-17:00') for d in ('monday', 'tuesday', 'wednesday',
+                'thursday', 'friday') ])
+        f.close()
+
+        f = open(self._objects_file('contacts.cfg'), 'w')
+        _define(f, 'contact', [('name', 'generic-contact'),
+            ('service_notification_period', '24x7'),
+            ('host_notification_period', '24x7'),
+            ('service_notification_options', 'w,u,c,r'),
+            ('host_notification_options', 'd,u,r'),
+            ('service_notification_commands', 'notify-service-by-email'),
+            ('host_notification_commands', 'notify-host-by-email'),
+            ('register', '0')])
+        for role in ROLES:
+            members = []
+            for k in range(3):
+                name = '%s-admin%d' % (role, k)
+                members.append(name)
+                _define(f, 'contact', [('contact_name', name),
+                    ('use', 'generic-contact'), ('alias', name),
+                    ('email', '%s@example.com' % name)])
+            _define(f, 'contactgroup', [('contactgroup_name', role + '-admins'),
+                ('alias', '%s administrators' % role),
+                ('members', ','.join(members))])
+        f.close()
+
+        f = open(self._objects_file('templates.cfg'), 'w')
+        _define(f, 'host', [('name', 'generic-host'),
+            ('notifications_enabled', '1'), ('event_handler_enabled', '1'),
+            ('flap_detection_enabled', '1'),
+            ('process_perf_data', '1'), ('notification_period', '24x7'),
+            ('check_period', '24x7'), ('check_interval', '5'),
+            ('retry_interval', '1'), ('max_check_attempts', '10'),
+            ('check_command', 'check-host-alive'),
+            ('notification_interval', '120'),
+            ('notification_options', 'd,u,r'), ('register', '0')])
+        _define(f, 'service', [('name', 'generic-service'),
+            ('active_checks_enabled', '1'), ('passive_checks_enabled', '1'),
+            ('notifications_enabled', '1'), ('check_period', '24x7'),
+            ('max_check_attempts', '3'), ('normal_check_interval', '10'),
+            ('retry_check_interval', '2'), ('notification_interval', '60'),
+            ('notification_period', '24x7'),
+            ('notification_options', 'w,u,c,r'), ('register', '0')])
+        for role in ROLES:
+            _define(f, 'host', [('name', role + '-server'),
+                ('use', 'generic-host'), ('contact_groups', role + '-admins'),
+                ('hostgroups', '+%s-servers' % role), ('register', '0')])
+            _define(f, 'service', [('name', role + '-service'),
+                ('use', 'generic-service'),
+                ('contact_groups', role + '-admins'), ('register', '0')])
+        f.close()
+
+        f = open(self._objects_file('groups.cfg'), 'w')
+        for role in ROLES:
+            _define(f, 'hostgroup', [('hostgroup_name', role + '-servers'),
+                ('alias', '%s servers' % role)])
+            for s, check in zip(GROUP_SERVICES,
+                    ['check_ping!100.0,20%!500.0,60%', 'check_ssh!-t 10']):
+                _define(f, 'service', [('use', role + '-service'),
+                    ('hostgroup_name', role + '-servers'),
+                    ('service_description', s), ('check_command', check)])
+        for site in range(SITES):
+            _define(f, 'hostgroup', [('hostgroup_name', 'site%02d' % site),
+                ('alias', 'Site %d' % site)])
+        _define(f, 'servicegroup', [('servicegroup_name', 'disks'),
+            ('alias', 'Disk space')])
+        f.close()
+
+    def write_hosts(self):
+        f = None
+        for i in range(self.hosts):
+            if i % HOSTS_PER_FILE == 0:
+                if f is not None:
+                    f.close()
+                d = os.path.join(self.hosts_dir, host_site(i))
+                if not os.path.isdir(d):
+                    os.makedirs(d)
+                f = open(os.path.join(d, 'hosts%07d.cfg' % i), 'w')
+                f.write('# hosts %d-%d\n\n' % (i, i + HOSTS_PER_FILE - 1))
+            name = host_name(i)
+            role = host_role(i)
+            attrs = [('host_name', name), ('use', role + '-server'),
+                ('alias', '%s %s server' % (host_site(i), role)),
+                ('address', '10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255,
+                    i & 255)),
+                ('hostgroups', '+' + host_site(i))]
+            if i >= HOSTS_PER_FILE and i % 7 == 0:
+                attrs.append(('parents', host_name(i - i % HOSTS_PER_FILE)))
+            _define(f, 'host', attrs)
+            for s, group in host_services(i):
+                if group:
+                    continue
+                attrs = [('use', role + '-service'), ('host_name', name),
+                    ('service_description', s),
+                    ('check_command', 'check_nrpe!check_%s' % \
+                            s.lower().replace(' ', '_').replace('/', 'root'))]
+                if s.startswith('DISK'):
+                    attrs.append(('servicegroups', 'disks'))
+                _define(f, 'service', attrs)
+        if f is not None:
+            f.close()
+
+    def _check_attrs(self, state, t):
+        r = self.random
+        return [('current_state', state), ('last_hard_state', state),
+            ('state_type', r.random() < 0.9 and 1 or 0),
+            ('current_attempt', 1), ('max_attempts', 3),
+            ('has_been_checked', 1), ('should_be_scheduled', 1),
+            ('check_execution_time', '%.3f' % r.uniform(0, 2)),
+            ('check_latency', '%.3f' % r.uniform(0, 1)), ('check_type', 0),
+            ('last_check', t), ('next_check', t + 300),
+            ('last_state_change', t - r.randint(0, 86400 * 30)),
+            ('last_hard_state_change', t - r.randint(0, 86400 * 30)),
+            ('last_notification', 0), ('next_notification', 0),
+            ('no_more_notifications', 0), ('current_notification_number', 0),
+            ('notifications_enabled', 1),
+            ('problem_has_been_acknowledged',
+                state and r.random() < 0.3 and 1 or 0),
+            ('acknowledgement_type', 0), ('active_checks_enabled', 1),
+            ('passive_checks_enabled', 1), ('event_handler_enabled', 1),
+            ('flap_detection_enabled', 1), ('process_performance_data', 1),
+            ('last_update', t), ('is_flapping', r.random() < 0.01 and 1 or 0),
+            ('percent_state_change', '%.2f' % r.uniform(0, 30)),
+            ('scheduled_downtime_depth', r.random() < 0.02 and 1 or 0)]
+
+    def _state(self, critical=0.03, warning=0.05, unknown=0.01):
+        x = self.random.random()
+        if x < critical:
+            return 2
+        elif x < critical + warning:
+            return 1
+        elif x < critical + warning + unknown:
+            return 3
+        return 0
+
+    def write_status(self, t=None):
+        """
+        Write status.dat as of time t
+        """
+        if t is None:
+            t = BASE_TIME
+        tmp = self.status_file + '.tmp'
+        f = open(tmp, 'w')
+        _status(f, 'info', [('created', t), ('version', '3.2.3'),
+            ('last_update_check', 0), ('update_available', 0)])
+        _status(f, 'programstatus', [('modified_host_attributes', 0),
+            ('modified_service_attributes', 0), ('nagios_pid', 1234),
+            ('daemon_mode', 1), ('program_start', BASE_TIME),
+            ('last_command_check', t), ('last_log_rotation', 0),
+            ('enable_notifications', 1), ('active_service_checks_enabled', 1),
+            ('passive_service_checks_enabled', 1),
+            ('active_host_checks_enabled', 1),
+            ('passive_host_checks_enabled', 1), ('enable_event_handlers', 1),
+            ('obsess_over_services', 0), ('obsess_over_hosts', 0),
+            ('check_service_freshness', 1), ('check_host_freshness', 0),
+            ('enable_flap_detection', 1), ('enable_failure_prediction', 1),
+            ('process_performance_data', 0), ('global_host_event_handler', ''),
+            ('global_service_event_handler', ''), ('next_comment_id', 1),
+            ('next_downtime_id', 1), ('next_event_id', 1),
+            ('next_problem_id', 1), ('next_notification_id', 1)])
+        comment_id = 1
+        comments = []
+        for i in range(self.hosts):
+            name = host_name(i)
+            state = self._state(0.01, 0, 0.005)
+            _status(f, 'hoststatus', [('host_name', name),
+                ('modified_attributes', 0),
+                ('check_command', 'check-host-alive'),
+                ('check_period', '24x7'), ('notification_period', '24x7'),
+                ('check_interval', '5.000000'),
+                ('retry_interval', '1.000000'), ('event_handler', ''),
+                ('plugin_output', state and 'CRITICAL - Host Unreachable' or
+                    'PING OK - Packet loss = 0%, RTA = 0.50 ms'),
+                ('long_plugin_output', ''),
+                ('performance_data', 'rta=%.3fms;3000.000;5000.000;0; pl=0%%;'
+                    '80;100;; ' % self.random.uniform(0.1, 5))] +
+                self._check_attrs(state, t))
+            for s, group in host_services(i):
+                state = self._state()
+                _status(f, 'servicestatus', [('host_name', name),
+                    ('service_description', s), ('modified_attributes', 0),
+                    ('check_command', 'check_nrpe'),
+                    ('check_period', '24x7'), ('notification_period', '24x7'),
+                    ('check_interval', '10.000000'),
+                    ('retry_interval', '2.000000'), ('event_handler', ''),
+                    ('plugin_output', '%s %s' % (s,
+                        ('OK', 'WARNING', 'CRITICAL', 'UNKNOWN')[state])),
+                    ('long_plugin_output', ''),
+                    ('performance_data', 'value=%d;80;90;0;100' % \
+                        self.random.randint(0, 100))] +
+                    self._check_attrs(state, t))
+                if state and self.random.random() < 0.2:
+                    comments.append(('servicecomment', [('host_name', name),
+                        ('service_description', s), ('entry_type', 1),
+                        ('comment_id', comment_id), ('source', 1),
+                        ('persistent', 1), ('entry_time', t - 3600),
+                        ('expires', 0), ('expire_time', 0),
+                        ('author', '%s-admin%d' % (host_role(i),
+                            comment_id % 3)),
+                        ('comment_data', 'looking into it')]))
+                    comment_id += 1
+        for obj_type, attrs in comments:
+            _status(f, obj_type, attrs)
+        f.close()
+        os.rename(tmp, self.status_file)
+
+    def write_log(self):
+        f = open(self.log_file, 'w')
+        f.write('[%d] Nagios 3.2.3 starting... (PID=1234)\n' % BASE_TIME)
+        f.write('[%d] LOG VERSION: 2.0\n' % BASE_TIME)
+        r = self.random
+        step = 86400.0 / max(1, self.log_lines)
+        for k in range(self.log_lines):
+            t = BASE_TIME + int(k * step)
+            i = r.randrange(self.hosts)
+            if k and k % 10000 == 0:
+                f.write('[%d] Caught SIGHUP, restarting...\n' % t)
+            x = r.random()
+            if x < 0.6:
+                s = host_services(i)[r.randrange(SERVICES_PER_HOST)][0]
+                state = r.choice(['OK', 'WARNING', 'CRITICAL'])
+                f.write('[%d] SERVICE ALERT: %s;%s;%s;%s;%d;%s %s\n' % (t,
+                    host_name(i), s, state, r.choice(['SOFT', 'HARD']),
+                    r.randint(1, 3), s, state))
+            elif x < 0.7:
+                f.write('[%d] HOST ALERT: %s;%s;HARD;10;PING %s\n' % (t,
+                    host_name(i), r.choice(['UP', 'DOWN']), 'CRITICAL'))
+            elif x < 0.8:
+                f.write('[%d] SERVICE NOTIFICATION: %s-admin0;%s;%s;CRITICAL;'
+                        'notify-service-by-email;CRITICAL\n' % (t,
+                            host_role(i), host_name(i),
+                            host_services(i)[-1][0]))
+            else:
+                f.write('[%d] EXTERNAL COMMAND: PROCESS_SERVICE_CHECK_RESULT;'
+                        '%s;%s;0;OK\n' % (t, host_name(i),
+                            host_services(i)[0][0]))
+        f.close()
+
+def generate(directory, services=1000, seed=0, log_lines=None):
+    """
+    Generate installation with given number of services in directory, returns
+    Dataset
+    """
+    ds = Dataset(directory, services, seed, log_lines)
+    ds.generate()
+    return ds
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    op = OptionParser(usage='%prog [options] directory')
+    op.add_option('-s', '--scale', default='1k',
+            help='number of services: %s or any number' % \
+                    ', '.join(sorted(SCALES)))
+    op.add_option('--seed', default=0, type='int',
+            help='seed of random generator')
+    op.add_option('--log-lines', default=None, type='int',
+            help='number of nagios.log records (number of services by '
+            'default)')
+    opts, args = op.parse_args()
+    if len(args) != 1:
+        op.error('directory is required')
+    services = SCALES.get(opts.scale.lower())
+    if services is None:
+        services = int(opts.scale)
+    ds = generate(args[0], services, opts.seed, opts.log_lines)
+    print ds.nagios_cfg
@@ -0,0 +1,272 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Benchmarks of NagData on generated installations.
+
+Every scale is measured in separate process (so peak memory is of that scale
+only) and reported as one JSON document per line:
+
+    {"scale": "10k", "services": 10000, "hosts": 1000, "python": "2.7.18",
+     "peak_rss_kb": 123456,
+     "results": {"startup": {"n": 3, "total_s": ..., "ops_per_s": ...,
+                             "mean_ms": ..., "p50_ms": ..., "p90_ms": ...,
+                             "p99_ms": ..., "max_ms": ...,
+                             "peak_rss_kb": ...},
+                 ...}}
+
+peak_rss_kb of benchmark is peak resident memory of process after it ran.
+
+Run as python -m benchmarks.run -s 1k,10k -o results.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import resource
+import tempfile
+import subprocess
+
+from generate import SCALES, Dataset, host_name, host_services
+
+def percentile(sorted_values, p):
+    """
+    Return p-th percentile (nearest rank) of sorted list
+    """
+    if not sorted_values:
+        return None
+    k = int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1
+    return sorted_values[min(max(k, 0), len(sorted_values) - 1)]
+
+def peak_rss_kb():
+    """
+    Return peak resident memory of this process in kilobytes
+    """
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        r //= 1024
+    return r
+
+def summary(times):
+    """
+    Return summary of list of durations (seconds) of operations
+    """
+    s = sorted(times)
+    total = sum(s)
+    ms = lambda v: v is not None and round(v * 1000, 4) or v
+    return {'n': len(s), 'total_s': round(total, 6),
+            'ops_per_s': total and round(len(s) / total, 2) or None,
+            'mean_ms': ms(s and total / len(s) or None),
+            'p50_ms': ms(percentile(s, 50)), 'p90_ms': ms(percentile(s, 90)),
+            'p99_ms': ms(percentile(s, 99)), 'max_ms': ms(s and s[-1] or None),
+            'peak_rss_kb': peak_rss_kb()}
+
+def timed(func, n):
+    """
+    Call func() n times, return list of durations
+    """
+    times = []
+    for i in xrange(n):
+        t = time.time()
+        func()
+        times.append(time.time() - t)
+    return times
+
+class Benchmark(object):
+    """
+    Benchmarks on one generated installation
+    """
+
+    def __init__(self, dataset, repeat=3, lookups=1000, seed=0):
+        """
+        dataset -- generated Dataset
+        repeat  -- how many times to repeat heavy operations (startup,
+                   update_status, save, nagios_reloaded)
+        lookups -- number of lookups in lookup benchmarks
+        """
+        self.ds = dataset
+        self.repeat = repeat
+        self.lookups = lookups
+        self.random = random.Random(seed)
+        self.nd = None
+
+    def _random_service(self):
+        i = self.random.randrange(self.ds.hosts)
+        return host_name(i), self.random.choice(host_services(i))[0]
+
+    def bench_startup(self):
+        from nagdata import nagdata
+        nds = []
+        def start():
+            nds.append(nagdata.NagDataSimpleApi(self.ds.nagios_cfg))
+        times = timed(start, self.repeat)
+        self.nd = nds[-1]
+        del nds[:-1]
+        return times
+
+    def bench_update_status(self):
+        return timed(self.nd.update_status, self.repeat)
+
+    def bench_filter(self):
+        queries = [ self._random_service() for i in xrange(self.lookups) ]
+        it = iter(queries)
+        def lookup():
+            h, s = it.next()
+            self.nd.filter(obj_type='servicestatus', host_name=h,
+                    service_description=s)
+        return timed(lookup, len(queries))
+
+    def bench_get_host(self):
+        queries = [ host_name(self.random.randrange(self.ds.hosts))
+                for i in xrange(self.lookups) ]
+        it = iter(queries)
+        return timed(lambda: self.nd.get_host(it.next()), len(queries))
+
+    def bench_get_servicestatus(self):
+        queries = [ self._random_service() for i in xrange(self.lookups) ]
+        it = iter(queries)
+        def lookup():
+            h, s = it.next()
+            self.nd.get_servicestatus(h, s)
+        return timed(lookup, len(queries))
+
+    def bench_host_servicestatuses(self):
+        queries = [ host_name(self.random.randrange(self.ds.hosts))
+                for i in xrange(self.lookups) ]
+        it = iter(queries)
+        return timed(lambda: self.nd.get_host_servicestatuses(it.next()),
+                len(queries))
+
+    def bench_save(self):
+        hosts = [ host_name(self.random.randrange(self.ds.hosts))
+                for i in xrange(self.repeat) ]
+        it = iter(hosts)
+        self.nd.keep_backup = False
+        def save():
+            h = self.nd.get_host(it.next())
+            h['alias'] = h['alias'] + ' (changed)'
+            self.nd.save(h)
+        return timed(save, len(hosts))
+
+    def bench_nagios_reloaded(self):
+        times = []
+        for i in xrange(self.repeat):
+            f = open(self.ds.log_file, 'a')
+            f.write('[%d] Caught SIGHUP, restarting...\n' % time.time())
+            f.close()
+            t = time.time()
+            self.nd.nagios_reloaded(since='0')
+            times.append(time.time() - t)
+        return times
+
+    # benchmarks in order they run, startup should be first
+    benchmarks = ['startup', 'update_status', 'filter', 'get_host',
+            'get_servicestatus', 'host_servicestatuses', 'save',
+            'nagios_reloaded']
+
+    def run(self, only=None):
+        """
+        Run benchmarks (only those in only if given), return dict name ->
+        summary
+        """
+        results = {}
+        for name in self.benchmarks:
+            if only and name != 'startup' and not name in only:
+                continue
+            results[name] = summary(getattr(self, 'bench_' + name)())
+        return results
+
+def run_scale(scale, services, directory=None, repeat=3, lookups=1000,
+        seed=0, only=None):
+    """
+    Generate installation of given number of services (in temporary
+    directory unless directory given) and benchmark it in this process,
+    returns report
+    """
+    tmp = None
+    if directory is None:
+        directory = tmp = tempfile.mkdtemp(prefix='nagdata-bench-')
+    try:
+        ds = Dataset(directory, services, seed)
+        t = time.time()
+        ds.generate()
+        generated = time.time() - t
+        results = Benchmark(ds, repeat, lookups, seed).run(only)
+        return {'scale': scale, 'services': ds.services, 'hosts': ds.hosts,
+                'python': '%d.%d.%d' % sys.version_info[:3],
+                'generate_s': round(generated, 3),
+                'peak_rss_kb': peak_rss_kb(), 'results': results}
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, True)
+
+def main(argv=None):
+    from optparse import OptionParser
+    op = OptionParser()
+    op.add_option('-s', '--scales', default='1k,10k',
+            help='comma-separated scales: %s or numbers of services' % \
+                    ', '.join(sorted(SCALES)))
+    op.add_option('-r', '--repeat', default=3, type='int',
+            help='repetitions of heavy operations')
+    op.add_option('-l', '--lookups', default=1000, type='int',
+            help='number of lookups in lookup benchmarks')
+    op.add_option('-b', '--benchmarks', default=None,
+            help='comma-separated benchmarks to run: %s' % \
+                    ', '.join(Benchmark.benchmarks))
+    op.add_option('-d', '--directory', default=None,
+            help='directory for generated files (temporary by default, '
+            'one scale only)')
+    op.add_option('-o', '--output', default=None,
+            help='append results to file instead of printing them')
+    op.add_option('--seed', default=0, type='int')
+    op.add_option('--in-process', action='store_true', default=False,
+            help='run in this process (used for every scale internally)')
+    opts, args = op.parse_args(argv)
+    scales = [ s.strip() for s in opts.scales.split(',') if s.strip() ]
+    only = opts.benchmarks and opts.benchmarks.split(',') or None
+    out = opts.output and open(opts.output, 'a') or sys.stdout
+    for scale in scales:
+        if opts.in_process:
+            services = SCALES.get(scale.lower())
+            if services is None:
+                services = int(scale)
+            line = json.dumps(run_scale(scale, services, opts.directory,
+                opts.repeat, opts.lookups, opts.seed, only), sort_keys=True)
+        else:
+            cmd = [sys.executable, '-m', 'benchmarks.run', '--in-process',
+                    '-s', scale, '-r', str(opts.repeat),
+                    '-l', str(opts.lookups), '--seed', str(opts.seed)]
+            if opts.directory:
+                cmd.extend(['-d', opts.directory])
+            if opts.benchmarks:
+                cmd.extend(['-b', opts.benchmarks])
+            line = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                    cwd=os.path.dirname(os.path.dirname(
+                        os.path.abspath(__file__)))).communicate()[0].strip()
+            if not line:
+                line = json.dumps({'scale': scale, 'error': 'failed'})
+        out.write(line + '\n')
+        out.flush()
+    if out is not sys.stdout:
+        out.close()
+
+if __name__ == '__main__':
+    main()
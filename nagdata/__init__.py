@@ -31,6 +31,17 @@ parser         -- parsers of nagios configuration and status files (parses list
 cparser_fmt    -- parse file and keep format
 cparser_fast   -- just parse file and don't save format
 nagfile        -- links together files and parsers, so we can parse files
+scanner        -- recursive scanning of configuration directories
+snapshot       -- status snapshots shared between processes via mmap
+daemon         -- query daemon serving NagData over Unix domain socket
+aio            -- asyncio-friendly loading and updating of NagData
+events         -- events about status changes between updates
+history        -- compact history of status objects over last updates
+dump           -- streaming binary export and import of collections
+sqlmirror      -- incremental SQLite mirror of config and status
+stats          -- timings and counters of nagdata internals
+memory         -- estimation of memory used by NagData
+trace          -- tracing of nagdata internals with spans
 collection     -- collection of Nagios objects
 factory        -- factories to produce different Nagios objects
 model          -- Nagios objects (hoststatus, servicestatus, service definition,
@@ -38,7 +49,14 @@ model          -- Nagios objects (hoststatus, servicestatus, service definition,
 fields         -- Types of Nagios object attributes
 fmt            -- "Imaginary" format object helping to keep nagios file format
                   and structure
-log            -- Object represenging nagios log file
+log            -- Object represenging nagios log file and incremental reader
+                  of it
+archive        -- parallel reading of Nagios log archives
+depgraph       -- graph of host and service dependencies, impact and root
+                  causes of problems
+inherit        -- effective attributes of objects inherited from templates
+hostservices   -- index of services applying to hosts (through hostgroups,
+                  lists and wildcards)
 
 """
 
@@ -0,0 +1,229 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Asyncio-friendly loading and updating of NagData.
+
+Files are read and parsed in executor, collections are indexed and ctimes of
+files are recorded in event loop (indexing by chunks of index_chunk objects),
+so loop keeps serving other tasks while update runs and NagData is changed
+only in loop thread. Methods return futures which may be awaited (or yielded from
+coroutines).
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from nagdata import NagDataSimpleApi
+from collection import NagCollection
+
+class AsyncUpdates(object):
+    """
+    Mixin to add asynchronous counterparts of load and update methods to
+    NagData with OnUpdateCallbacks. Should precede OnUpdateCallbacks and
+    NagData in bases.
+    """
+    # event loop, None means asyncio.get_event_loop()
+    loop = None
+    # executor to parse files in, None means loop's default executor
+    executor = None
+    # how many objects to index before giving control back to loop
+    index_chunk = 1000
+
+    def _get_loop(self):
+        return self.loop or asyncio.get_event_loop()
+
+    def _then(self, fut, func):
+        """
+        Return future resolved with func(result of fut), func may return
+        future too
+        """
+        loop = self._get_loop()
+        res = asyncio.Future(loop=loop)
+        def done(f):
+            if f.cancelled():
+                res.cancel()
+                return
+            if f.exception() is not None:
+                res.set_exception(f.exception())
+                return
+            try:
+                r = func(f.result())
+            except Exception, e:
+                res.set_exception(e)
+                return
+            if isinstance(r, asyncio.Future):
+                r.add_done_callback(done_result)
+            else:
+                res.set_result(r)
+        def done_result(f):
+            if f.cancelled():
+                res.cancel()
+            elif f.exception() is not None:
+                res.set_exception(f.exception())
+            else:
+                res.set_result(f.result())
+        fut.add_done_callback(done)
+        return res
+
+    def index_async(self, colls, coll):
+        """
+        Add objects of collections colls to collection coll by chunks in event
+        loop, returns future resolved with coll
+        """
+        loop = self._get_loop()
+        res = asyncio.Future(loop=loop)
+        objs = iter([ o for c in colls for o in c ])
+        chunk = self.index_chunk
+        def step():
+            try:
+                n = 0
+                for o in objs:
+                    coll.add(o)
+                    n += 1
+                    if n >= chunk:
+                        break
+            except Exception, e:
+                res.set_exception(e)
+                return
+            if n < chunk:
+                res.set_result(coll)
+            else:
+                loop.call_soon(step)
+        loop.call_soon(step)
+        return res
+
+    def load_config_async(self):
+        """
+        Asynchronous load_config, returns future resolved with (nagios.cfg,
+        config collection)
+        """
+        def index(r):
+            cfg, colls, ctimes = r
+            self._config_read(cfg, ctimes)
+            return self._then(self.index_async([[cfg]] + colls,
+                NagCollection(obj_group='config')), lambda nco: (cfg, nco))
+        return self._then(self._get_loop().run_in_executor(self.executor,
+            self.read_config), index)
+
+    def load_status_async(self):
+        """
+        Asynchronous load_status, returns future resolved with (status
+        collection, ctime)
+        """
+        def index(r):
+            objs, ctime = r
+            return self._then(self.index_async([objs], NagCollection()),
+                    lambda nso: (nso, ctime))
+        return self._then(self._get_loop().run_in_executor(self.executor,
+            self.read_status), index)
+
+    def load_config_file_async(self, filename):
+        """
+        Asynchronous load_config_file
+        """
+        def record(r):
+            ctime, objs = r
+            self._config_file_read(filename, ctime)
+            return objs
+        return self._then(self._get_loop().run_in_executor(self.executor,
+            self.read_config_file, filename), record)
+
+    def update_config_async(self):
+        """
+        Asynchronous update_config
+        """
+        return self._then(self.load_config_async(),
+                lambda r: self.replace_config(*r))
+
+    def update_config_file_async(self, filename):
+        """
+        Asynchronous update_config_file
+        """
+        loop = self._get_loop()
+        def replace(r):
+            ctime, objs = r
+            if filename == self.nagios_cfg:
+                self.replace_main_config(objs)
+                self._config_file_read(filename, ctime, objs)
+            else:
+                self.replace_config_file(filename, objs)
+                self._config_file_read(filename, ctime)
+        if filename == self.nagios_cfg:
+            read = self.read_main_config
+        else:
+            read = lambda: self.read_config_file(filename)
+        return self._then(loop.run_in_executor(self.executor, read), replace)
+
+    def update_status_async(self):
+        """
+        Asynchronous update_status
+        """
+        return self._then(self.load_status_async(),
+                lambda r: self.replace_status(*r))
+
+    def _waiters(self, name):
+        return self.__dict__.setdefault('_waiters_' + name, [])
+
+    def _wake(self, name, value):
+        """
+        Resolve futures waiting for update, may be called from any thread
+        """
+        waiters = self._waiters(name)
+        self.__dict__['_waiters_' + name] = []
+        for loop, fut in waiters:
+            def set_result(fut=fut):
+                if not fut.done():
+                    fut.set_result(value)
+            loop.call_soon_threadsafe(set_result)
+
+    def next_config_update(self):
+        """
+        Return future resolved with config collection after next update of
+        configuration
+        """
+        loop = self._get_loop()
+        fut = asyncio.Future(loop=loop)
+        self._waiters('config').append((loop, fut))
+        return fut
+
+    def next_status_update(self):
+        """
+        Return future resolved with status collection after next update of
+        status
+        """
+        loop = self._get_loop()
+        fut = asyncio.Future(loop=loop)
+        self._waiters('status').append((loop, fut))
+        return fut
+
+    def after_update_config(self):
+        super(AsyncUpdates, self).after_update_config()
+        self._wake('config', self.config)
+
+    def after_update_status(self):
+        super(AsyncUpdates, self).after_update_status()
+        self._wake('status', self.status)
+
+class NagDataAsync(AsyncUpdates, NagDataSimpleApi):
+    """
+    NagData with simple api, callbacks on update and asynchronous updates
+    """
+    pass
@@ -0,0 +1,337 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Reading of Nagios log archives (log_archive_path).
+
+Archive files (nagios-MM-DD-YYYY-HH.log, may be gzipped) are parsed in
+process pool into per-file caches of records (in blocks) and their records
+are streamed from caches merged in time order, so only one block of every
+file is in memory. Caches are kept in cache_dir if it is given and are used
+while size and mtime of file are the same, so archives are parsed once:
+
+    from nagdata import archive
+    a = archive.LogArchive('/var/log/nagios/archives',
+            cache_dir='/var/cache/nagdata/archives')
+    store = a.store(start=time.time() - 30 * 86400)
+    for ev in store.events('HOST ALERT', host_name='router1'):
+        ...
+"""
+
+import os
+import re
+import gzip
+import time
+import heapq
+import shutil
+import hashlib
+import marshal
+import tempfile
+import multiprocessing
+
+from parser import LogParser
+from log import LogStore, parse_event
+
+# nagios-MM-DD-YYYY-HH.log, named by time of rotation
+archive_re = re.compile('^nagios-(\d\d)-(\d\d)-(\d\d\d\d)-(\d\d)\.log(\.gz)?$')
+
+# version of cache files
+CACHE_VERSION = 2
+# number of records in one block of cache
+BLOCK_SIZE = 1000
+
+def archive_time(filename):
+    """
+    Return time of rotation from name of archive file, None if it is not
+    archive file
+    """
+    m = archive_re.match(os.path.basename(filename))
+    if not m:
+        return None
+    month, day, year, hour = [ int(x) for x in m.groups()[:4] ]
+    return int(time.mktime((year, month, day, hour, 0, 0, 0, 0, -1)))
+
+def iter_records(filename):
+    """
+    Yield records (timestamp, message) of log file in order of file, gzipped
+    file (*.gz) is decompressed while reading
+    """
+    if filename.endswith('.gz'):
+        f = gzip.open(filename, 'rb')
+    else:
+        f = open(filename, 'rb')
+    rec_match = LogParser.rec_re.match
+    try:
+        for l in f:
+            m = rec_match(l.rstrip('\r\n'))
+            if m:
+                ts, msg = m.groups()
+                try:
+                    yield (int(ts), msg)
+                except ValueError:
+                    pass
+    finally:
+        f.close()
+
+def _cache_files(cache_dir, filename):
+    """
+    Return (summary file, records file) of cache of log file, names have hash
+    of full path of file, so archives of several directories may share
+    cache_dir
+    """
+    path = os.path.abspath(filename)
+    base = os.path.join(cache_dir, '%s.%s' % (os.path.basename(path),
+        hashlib.md5(path).hexdigest()[:12]))
+    return base + '.summary', base + '.records'
+
+def _file_key(filename):
+    st = os.stat(filename)
+    return (st.st_size, int(st.st_mtime))
+
+def read_cache(cache_dir, filename):
+    """
+    Return summary of file from cache, None if there is no valid cache for it
+    """
+    summary_file, records_file = _cache_files(cache_dir, filename)
+    try:
+        f = open(summary_file, 'rb')
+    except IOError:
+        return None
+    try:
+        try:
+            version, key, summary = marshal.load(f)
+        except (EOFError, ValueError, TypeError):
+            return None
+    finally:
+        f.close()
+    if version != CACHE_VERSION or key != _file_key(filename) \
+            or not os.path.exists(records_file):
+        return None
+    return summary
+
+def cache_records(records_file):
+    """
+    Yield records from records file of cache block by block
+    """
+    f = open(records_file, 'rb')
+    try:
+        while True:
+            try:
+                block = marshal.load(f)
+            except EOFError:
+                break
+            for r in block:
+                yield r
+    finally:
+        f.close()
+
+def _write_blocks(f, records):
+    block = []
+    for r in records:
+        block.append(r)
+        if len(block) >= BLOCK_SIZE:
+            marshal.dump(block, f, 2)
+            block = []
+    if block:
+        marshal.dump(block, f, 2)
+
+def parse_file(args):
+    """
+    Parse log file into cache in cache_dir, returns (summary, records file of
+    cache), args is (filename, cache_dir). Summary has first and last
+    timestamp, number of records and number of events of every type. Runs in
+    worker processes.
+    """
+    filename, cache_dir = args
+    key = _file_key(filename)
+    summary_file, records_file = _cache_files(cache_dir, filename)
+    tmp = '%s.%d.tmp' % (records_file, os.getpid())
+    summary = {'first': None, 'last': None, 'records': 0, 'events': {}}
+    events = summary['events']
+    state = {'sorted': True, 'last': None}
+    def counted(records):
+        for r in records:
+            ts = r[0]
+            if state['last'] is not None and ts < state['last']:
+                state['sorted'] = False
+            state['last'] = ts
+            if summary['first'] is None or ts < summary['first']:
+                summary['first'] = ts
+            if summary['last'] is None or ts > summary['last']:
+                summary['last'] = ts
+            summary['records'] += 1
+            ev = parse_event(ts, r[1])
+            if ev is not None:
+                events[ev['event_type']] = events.get(ev['event_type'], 0) + 1
+            yield r
+    f = open(tmp, 'wb')
+    try:
+        _write_blocks(f, counted(iter_records(filename)))
+    finally:
+        f.close()
+    if not state['sorted']:
+        # rare, records of this file only are sorted in memory
+        records = sorted(cache_records(tmp), key=lambda r: r[0])
+        f = open(tmp, 'wb')
+        try:
+            _write_blocks(f, records)
+        finally:
+            f.close()
+        del records
+    os.rename(tmp, records_file)
+    tmp = '%s.%d.tmp' % (summary_file, os.getpid())
+    f = open(tmp, 'wb')
+    try:
+        marshal.dump((CACHE_VERSION, key, summary), f, 2)
+    finally:
+        f.close()
+    os.rename(tmp, summary_file)
+    return summary, records_file
+
+class LogArchive(object):
+    """
+    Log archive directory, optionally with current log file
+    """
+
+    def __init__(self, path, log_file=None, cache_dir=None, processes=None):
+        """
+        path      -- directory of archive files (log_archive_path)
+        log_file  -- current log file (log_file), read after archives (never
+                     cached)
+        cache_dir -- directory to keep caches of parsed files in, if it is
+                     None caches are written to temporary directory and
+                     removed after reading
+        processes -- number of worker processes (number of CPUs by default),
+                     1 or less means parse in calling process
+        """
+        self.path = path
+        self.log_file = log_file
+        self.cache_dir = cache_dir
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def files(self, start=None, end=None):
+        """
+        Return archive files which may contain records with start <= timestamp
+        < end, sorted by time. Archive contains records up to its rotation
+        time after rotation time of previous one.
+        """
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            names = []
+        files = []
+        for n in names:
+            t = archive_time(n)
+            if t is not None:
+                files.append((t, os.path.join(self.path, n)))
+        files.sort()
+        res = []
+        prev = None
+        for t, fn in files:
+            if (start is None or t >= start) and \
+                    (end is None or prev is None or prev < end):
+                res.append(fn)
+            prev = t
+        return res
+
+    def _map(self, func, args):
+        """
+        Map func over args, in process pool if there is enough work for it
+        """
+        if self.processes <= 1 or len(args) <= 1:
+            return map(func, args)
+        pool = multiprocessing.Pool(min(self.processes, len(args)))
+        try:
+            return pool.map(func, args, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def parse(self, files, cache_dir):
+        """
+        Return {filename: (summary, records file of cache)} of files, using
+        valid caches in cache_dir (e.g. self.cache_dir) and parsing other files
+        in process pool into it
+        """
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        res = {}
+        todo = []
+        for fn in files:
+            summary = read_cache(cache_dir, fn)
+            if summary is not None:
+                res[fn] = (summary, _cache_files(cache_dir, fn)[1])
+            else:
+                todo.append(fn)
+        parsed = self._map(parse_file, [ (fn, cache_dir) for fn in todo ])
+        res.update(zip(todo, parsed))
+        return res
+
+    def _temp_cache(self):
+        """
+        Return (cache directory, whether it is temporary)
+        """
+        if self.cache_dir:
+            return self.cache_dir, False
+        return tempfile.mkdtemp(prefix='nagdata-archive-'), True
+
+    def summaries(self, start=None, end=None):
+        """
+        Return {filename: summary} of archive files (see parse_file)
+        """
+        cache_dir, temp = self._temp_cache()
+        try:
+            return dict([ (fn, summary) for fn, (summary, records_file)
+                in self.parse(self.files(start, end), cache_dir).items() ])
+        finally:
+            if temp:
+                shutil.rmtree(cache_dir, True)
+
+    def records(self, start=None, end=None):
+        """
+        Yield records (timestamp, message) of archives (and current log file)
+        with start <= timestamp < end merged in time order. Files are parsed
+        at first iteration, records are streamed from caches.
+        """
+        cache_dir, temp = self._temp_cache()
+        try:
+            files = self.files(start, end)
+            parsed = self.parse(files, cache_dir)
+            iters = [ cache_records(parsed[fn][1]) for fn in files
+                if parsed[fn][0]['records'] ]
+            if self.log_file and os.path.exists(self.log_file):
+                iters.append(iter_records(self.log_file))
+            for ts, msg in heapq.merge(*iters):
+                if start is not None and ts < start:
+                    continue
+                if end is not None and ts >= end:
+                    break
+                yield (ts, msg)
+        finally:
+            if temp:
+                shutil.rmtree(cache_dir, True)
+
+    def store(self, start=None, end=None):
+        """
+        Return LogStore of records with start <= timestamp < end
+        """
+        return LogStore(self.records(start, end))
@@ -21,8 +21,14 @@ Collection of Nagios objects
 """
 
 import copy
+import contextlib
 from factory import NagiosFactory
 from exceptions import NotUnique, UnsuitableObjGroup
+from stats import stats
+from trace import traced
+
+# marks attribute which object did not have
+_ABSENT = object()
 
 class NagCollection(object):
     """
@@ -44,6 +50,11 @@ class NagCollection(object):
         self._obj_group = obj_group
         # tag -> value -> set of objects
         self.tags = {}
+        # ids of sets of objects shared with copy of collection (see copy)
+        self._shared = None
+        # changes made in batch: id(object) -> (object, __id before batch,
+        # attr -> value before batch)
+        self._batch = None
 
     def add(self, nagobj):
         """
@@ -70,7 +81,7 @@ class NagCollection(object):
             if t in self.tags:
                 tgs = self.tags[t]
                 if f in tgs:
-                    tgs[f].add(nagobj)
+                    self._tagged(tgs, f).add(nagobj)
                 else:
                     tgs[f] = set([nagobj])
             else:
@@ -96,15 +107,36 @@ class NagCollection(object):
                             break
         else:
             x = set()
+        if stats.enabled:
+            stats.incr('nagdata_filter', tag=items[0][0],
+                    result=x and 'hit' or 'miss')
         return x
 
+    def index_sizes(self):
+        """
+        Return dict tag -> (number of distinct values, number of entries) of
+        tag indexes
+        """
+        return dict([ (t, (len(values), sum(map(len, values.itervalues()))))
+            for t, values in self.tags.items() ])
+
     def remove(self, nagobj):
         """
         Remove object from collection
         """
+        if self._batch and id(nagobj) in self._batch:
+            # indexes still have values object had before batch
+            o, orig_id, orig = self._batch.pop(id(nagobj))
+            cur = self._values(nagobj, orig)
+            self._set_values(nagobj, orig, orig_id)
+            self.remove(nagobj)
+            self._set_values(nagobj, cur)
+            return
+        if not nagobj in self._set:
+            return
         for g in nagobj.tags:
             if g in nagobj:
-                self.tags[g][nagobj[g]].discard(nagobj)
+                self._tagged(self.tags[g], nagobj[g]).discard(nagobj)
         self._set.discard(nagobj)
         nagobj.collection = None
 
@@ -130,10 +162,10 @@ class NagCollection(object):
                 tgs = self.tags
                 if tag in tgs:
                     if not prev is None and prev in tgs[tag]:
-                        tgs[tag][prev].discard(nagobj)
+                        self._tagged(tgs[tag], prev).discard(nagobj)
                     if not cur is None:
                         if cur in tgs[tag]:
-                            tgs[tag][cur].add(nagobj)
+                            self._tagged(tgs[tag], cur).add(nagobj)
                         else:
                             tgs[tag][cur] = set([nagobj])
                 elif not cur is None:
@@ -155,7 +187,49 @@ class NagCollection(object):
         for o in self._set:
             o.collection = None
         self._set.clear()
+        self._shared = None
+
+    def copy(self):
+        """
+        Return copy of collection, objects are moved to it (their collection
+        becomes the copy). Sets of tagged objects are shared between both
+        collections until one of them changes the set (or unshare is
+        called), so copying costs only copying of tag dicts.
+        """
+        c = self.__class__(self.notags, self._obj_group)
+        c._set = set(self._set)
+        shared = set()
+        for t, tgs in self.tags.items():
+            c.tags[t] = dict(tgs)
+            shared.update([ id(x) for x in tgs.itervalues() ])
+        if self._shared:
+            shared.update(self._shared)
+        self._shared = c._shared = shared
+        if not self.notags:
+            for o in c._set:
+                o.collection = c
+        return c
 
+    def unshare(self):
+        """
+        Forget sets of objects shared with copies of collection (or collection
+        it was copied from), call it when they are not changed anymore (e.g.
+        when copy replaces original)
+        """
+        self._shared = None
+
+    def _tagged(self, tgs, value):
+        """
+        Return set of objects tgs[value] which may be changed: if it is shared
+        with copy of collection, it is copied first
+        """
+        x = tgs[value]
+        if self._shared and id(x) in self._shared:
+            x = tgs[value] = set(x)
+        return x
+
+    @traced('NagCollection.extend', lambda self, coll: {'objects':
+        hasattr(coll, '__len__') and len(coll) or None})
     def extend(self, coll):
         """
         Extend collection with another
@@ -175,6 +249,105 @@ class NagCollection(object):
                 self.remove(x.pop())
             self.add(o)
 
+    def update_file(self, filename, coll):
+        """
+        Replace objects loaded from filename with objects from coll: objects
+        which are not in coll anymore are removed, objects from coll are added
+        replacing those with the same __id
+        """
+        for o in self.filter(__filename=filename):
+            self.remove(o)
+        self.update(coll)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context in which changes of objects' attributes do not update indexes
+        (so filter may give stale results for changed objects). Indexes of
+        every changed object are updated once at exit. If primary keys become
+        not unique, all changes made in context are rolled back and NotUnique
+        listing all such objects is raised. Changes are also rolled back if
+        exception is raised in context.
+        """
+        if self._batch is not None or self.notags:
+            yield self
+            return
+        self._batch = {}
+        try:
+            yield self
+        except:
+            batch, self._batch = self._batch, None
+            for o, orig_id, orig in batch.values():
+                self._set_values(o, orig, orig_id)
+            raise
+        batch, self._batch = self._batch, None
+        self._commit_batch(batch.values())
+
+    def deferred(self, nagobj, attr):
+        """
+        Called by object before it changes attr, returns True if updating of
+        indexes is deferred by batch
+        """
+        if self._batch is None:
+            return False
+        k = id(nagobj)
+        if not k in self._batch:
+            self._batch[k] = (nagobj, nagobj['__id'], {})
+        orig = self._batch[k][2]
+        if not attr in orig:
+            orig[attr] = dict.get(nagobj, attr, _ABSENT)
+        return True
+
+    def _values(self, nagobj, attrs):
+        """
+        Return current values of attrs of object
+        """
+        return dict([ (a, dict.get(nagobj, a, _ABSENT)) for a in attrs ])
+
+    def _set_values(self, nagobj, values, __id=None):
+        """
+        Set object's attributes bypassing indexes, then set its __id (or
+        compute it from primary key)
+        """
+        for a, v in values.items():
+            if v is _ABSENT:
+                dict.pop(nagobj, a, None)
+            else:
+                dict.__setitem__(nagobj, a, v)
+        if __id is None:
+            nagobj.update_pk()
+        else:
+            nagobj.set_id(__id)
+
+    def _commit_batch(self, changed):
+        """
+        Update indexes of objects changed in batch
+        """
+        current = []
+        for o, orig_id, orig in changed:
+            current.append(self._values(o, orig))
+            # remove with values which are in indexes
+            self._set_values(o, orig, orig_id)
+            self.remove(o)
+        ids = {}
+        violations = []
+        for (o, orig_id, orig), cur in zip(changed, current):
+            self._set_values(o, cur)
+            i = o['__id']
+            if i in ids or self.filter(__id=i):
+                violations.append(o)
+            ids[i] = o
+        if violations:
+            msg = "Objects already exist in collection: %s" % \
+                    '; '.join([ "'%s' with %s" % (o.obj_type, o.pkey_repr())
+                        for o in violations ])
+            for o, orig_id, orig in changed:
+                self._set_values(o, orig, orig_id)
+                self.add(o)
+            raise NotUnique(msg)
+        for o, orig_id, orig in changed:
+            self.add(o)
+
     def __iter__(self):
         return self._set.__iter__()
 
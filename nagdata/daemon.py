@@ -0,0 +1,271 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Query daemon: keeps one NagDataSimpleApi fresh and serves queries to many
+local clients over Unix domain socket.
+
+Protocol: every request and response is a frame of 4-byte big-endian length
+followed by JSON document. Request is
+    {"id": <any>, "method": <name>, "args": [...], "kwargs": {...}}
+response is
+    {"id": <same>, "result": <result>}
+or
+    {"id": <same>, "error": <exception class name>, "message": <text>}
+Objects in results are represented as BaseNagObj.to_structure, sets and lists
+of objects as lists of them.
+
+Run as python -m nagdata.daemon -c /etc/nagios/nagios.cfg -s /path/to/socket
+"""
+
+import os
+import json
+import socket
+import struct
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from nagdata import NagDataSimpleApi, SimpleApi
+from factory import NagiosFactory
+from exceptions import NagDataError
+import exceptions
+import model
+
+FRAME_HEADER = struct.Struct('!I')
+# do not accept requests larger than this
+MAX_FRAME = 16 * 1024 * 1024
+
+# methods of NagData which clients may call
+QUERY_METHODS = set(['filter', 'get', 'getall', 'get_or_none']) | \
+        set([ m for m in SimpleApi.__dict__ if m.startswith('get_') ])
+
+def encode_frame(doc):
+    """
+    Return frame containing doc
+    """
+    s = json.dumps(doc, separators=(',', ':'))
+    return FRAME_HEADER.pack(len(s)) + s
+
+def to_result(value):
+    """
+    Convert result of query to structure which may be sent to client
+    """
+    if isinstance(value, model.BaseNagObj):
+        return value.to_structure()
+    elif isinstance(value, (set, list, tuple)):
+        return [ to_result(v) for v in value ]
+    else:
+        return value
+
+class QueryProtocol(asyncio.Protocol):
+    """
+    Connection with one client
+    """
+
+    def __init__(self, daemon):
+        self.daemon = daemon
+        self.transport = None
+        self._buf = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        buf = self._buf
+        buf.extend(data)
+        while len(buf) >= FRAME_HEADER.size:
+            n = FRAME_HEADER.unpack_from(str(buf[:FRAME_HEADER.size]))[0]
+            if n > MAX_FRAME:
+                self.transport.close()
+                return
+            if len(buf) < FRAME_HEADER.size + n:
+                break
+            frame = str(buf[FRAME_HEADER.size:FRAME_HEADER.size + n])
+            del buf[:FRAME_HEADER.size + n]
+            self.transport.write(encode_frame(self.daemon.handle(frame)))
+
+class NagDataDaemon(object):
+    """
+    Serves queries to NagData object over Unix domain socket, checks for
+    outdated status and configuration every interval seconds
+    """
+
+    def __init__(self, nd, path, interval=5, loop=None, executor=None):
+        """
+        nd       -- NagData object (with SimpleApi) to serve
+        path     -- path of Unix domain socket
+        interval -- how often to check whether status or config is outdated
+        executor -- executor to load files in (loop's default executor if it
+                    is None)
+        """
+        self.nd = nd
+        self.path = path
+        self.interval = interval
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = executor
+        self.server = None
+
+    def handle(self, frame):
+        """
+        Handle request frame and return response
+        """
+        rid = None
+        try:
+            req = json.loads(frame)
+            rid = req.get('id')
+            method = req['method']
+            if not method in QUERY_METHODS:
+                raise NagDataError("Method '%s' is not allowed" % method)
+            kwargs = dict([ (str(k), v)
+                for k, v in req.get('kwargs', {}).items() ])
+            result = getattr(self.nd, method)(*req.get('args', []), **kwargs)
+            return {'id': rid, 'result': to_result(result)}
+        except Exception, e:
+            return {'id': rid, 'error': e.__class__.__name__,
+                    'message': str(e)}
+
+    def load_updates(self):
+        """
+        Load outdated status and configuration files, returns (loaded status
+        or None, loaded config files). Runs in executor and only reads files:
+        collections served to clients and ctimes of files are changed by
+        _replace in event loop.
+        """
+        status = None
+        if self.nd.status_outdated():
+            status = self.nd.load_status()
+        changes, loaded = self.nd.load_outdated_config()
+        return status, loaded
+
+    def refresh(self):
+        """
+        Update status and configuration if they are outdated. Files are read
+        and parsed in executor, so clients are served meanwhile; collections
+        are replaced in event loop.
+        """
+        fut = self.loop.run_in_executor(self.executor, self.load_updates)
+        fut.add_done_callback(self._replace)
+
+    def _replace(self, fut):
+        try:
+            status, loaded = fut.result()
+            if status is not None:
+                self.nd.replace_status(*status)
+            self.nd.replace_outdated_config(loaded)
+        finally:
+            self.loop.call_later(self.interval, self.refresh)
+
+    def start(self):
+        """
+        Start listening and refreshing in event loop
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = self.loop.run_until_complete(
+                self.loop.create_unix_server(
+                    lambda: QueryProtocol(self), self.path))
+        self.loop.call_later(self.interval, self.refresh)
+
+    def stop(self):
+        """
+        Stop listening and remove socket
+        """
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.stop()
+
+class NagDataClient(object):
+    """
+    Blocking client of NagDataDaemon. Query methods of NagData and SimpleApi
+    are called remotely and return objects created by factory.
+    """
+
+    def __init__(self, path, factory=NagiosFactory):
+        self.factory = factory
+        model.register_all_classes(self.factory)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self._id = 0
+
+    def _recv(self, n):
+        chunks = []
+        while n:
+            s = self.sock.recv(n)
+            if not s:
+                raise NagDataError('Connection closed by daemon')
+            chunks.append(s)
+            n -= len(s)
+        return ''.join(chunks)
+
+    def call(self, method, *args, **kwargs):
+        """
+        Call method of daemon's NagData, return raw result
+        """
+        self._id += 1
+        self.sock.sendall(encode_frame({'id': self._id, 'method': method,
+            'args': args, 'kwargs': kwargs}))
+        n = FRAME_HEADER.unpack(self._recv(FRAME_HEADER.size))[0]
+        resp = json.loads(self._recv(n))
+        if 'error' in resp:
+            exc = getattr(exceptions, resp['error'], NagDataError)
+            if not (isinstance(exc, type) and issubclass(exc, NagDataError)):
+                exc = NagDataError
+            raise exc(resp['message'])
+        return resp['result']
+
+    def _to_object(self, r):
+        if isinstance(r, dict) and 'obj_type' in r and 'fields' in r:
+            return self.factory.from_structure(r)
+        elif isinstance(r, list):
+            return [ self._to_object(x) for x in r ]
+        return r
+
+    def __getattr__(self, method):
+        if not method in QUERY_METHODS:
+            raise AttributeError(method)
+        def query(*args, **kwargs):
+            return self._to_object(self.call(method, *args, **kwargs))
+        return query
+
+    def close(self):
+        self.sock.close()
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    op = OptionParser()
+    op.add_option('-c', '--config', default='/etc/nagios/nagios.cfg',
+            help='Nagios configuration file')
+    op.add_option('-s', '--socket', default='/var/run/nagdata.sock',
+            help='Unix domain socket to listen on')
+    op.add_option('-i', '--interval', default=5, type='float',
+            help='interval of checks for outdated status and configuration')
+    opts, args = op.parse_args()
+    NagDataDaemon(NagDataSimpleApi(opts.config), opts.socket,
+            opts.interval).serve_forever()
@@ -0,0 +1,281 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Graph of dependencies between hosts and services.
+
+Nodes are host names and (host_name, service_description) tuples, edge from
+master to dependent means that dependent is impacted when master fails.
+Edges are built from host parents, hostdependency and servicedependency
+definitions (with host and hostgroup lists) and from hosts to their services
+(taken from status if it is given, it has every service of every host).
+
+    g = depgraph.DependencyGraph(n.config, n.status)
+    g.impact('router1')                  # everything behind router1
+    g.root_causes(('web1', 'HTTP'), n.status)
+    g.problems(n.status)                 # root problems and their impact
+"""
+
+from collections import deque
+
+def split_list(value):
+    """
+    Return list of names from comma-separated value (or list of values),
+    leading '+' of additive values is stripped
+    """
+    if value is None:
+        return []
+    if not isinstance(value, basestring):
+        value = ','.join([ str(v) for v in value ])
+    value = value.lstrip('+')
+    return [ v.strip() for v in value.split(',') if v.strip() ]
+
+def registered(nagobj):
+    """
+    Check if object is real object, not template
+    """
+    return str(nagobj.get('register', '1')).strip() != '0'
+
+def host_groups(config):
+    """
+    Return dict hostgroup_name -> set of host names, from members of
+    hostgroups and hostgroups of hosts
+    """
+    groups = {}
+    for g in config.filter(obj_type='hostgroup'):
+        if registered(g) and 'hostgroup_name' in g:
+            groups.setdefault(g['hostgroup_name'], set()).update(
+                    split_list(g.get('members')))
+    for h in config.filter(obj_type='host'):
+        if registered(h) and 'host_name' in h:
+            for name in split_list(h.get('hostgroups')):
+                groups.setdefault(name, set()).add(h['host_name'])
+    return groups
+
+def _hosts(nagobj, host_attr, group_attr, groups):
+    """
+    Return set of host names given by host and hostgroup attributes
+    """
+    hosts = set(split_list(nagobj.get(host_attr)))
+    for g in split_list(nagobj.get(group_attr)):
+        hosts.update(groups.get(g, ()))
+    return hosts
+
+def _failing(status):
+    """
+    Return set of nodes which are not OK (UP) in status
+    """
+    failing = set()
+    for s in status.filter(obj_type='hoststatus'):
+        if int(s.get('current_state', 0)) != 0:
+            failing.add(s['host_name'])
+    for s in status.filter(obj_type='servicestatus'):
+        if int(s.get('current_state', 0)) != 0:
+            failing.add((s['host_name'], s['service_description']))
+    return failing
+
+class DependencyGraph(object):
+    """
+    Adjacency graph of dependencies (see module documentation)
+    """
+
+    def __init__(self, config=None, status=None):
+        # node -> set of dependent nodes
+        self.dependents = {}
+        # node -> set of master nodes
+        self.masters = {}
+        # (host_name, service_description) of services linked to their hosts
+        # from status, None if they are linked from config
+        self.status_services = None
+        if config is not None:
+            self.build(config, status)
+
+    def add_edge(self, master, dependent):
+        if master == dependent:
+            return
+        self.dependents.setdefault(master, set()).add(dependent)
+        self.masters.setdefault(dependent, set()).add(master)
+
+    def remove_edge(self, master, dependent):
+        for edges, a, b in ((self.dependents, master, dependent),
+                (self.masters, dependent, master)):
+            nodes = edges.get(a)
+            if nodes is not None:
+                nodes.discard(b)
+                if not nodes:
+                    del edges[a]
+
+    def build(self, config, status=None):
+        """
+        Build graph from config collection, hosts are linked to their services
+        from status if it is given, otherwise from services with host_name
+        """
+        self.dependents = {}
+        self.masters = {}
+        self.status_services = None
+        groups = host_groups(config)
+        for h in config.filter(obj_type='host'):
+            if registered(h) and 'host_name' in h:
+                for p in split_list(h.get('parents')):
+                    self.add_edge(p, h['host_name'])
+        for d in config.filter(obj_type='hostdependency'):
+            if not registered(d):
+                continue
+            dependents = _hosts(d, 'dependent_host_name',
+                    'dependent_hostgroup_name', groups)
+            for m in _hosts(d, 'host_name', 'hostgroup_name', groups):
+                for dh in dependents:
+                    self.add_edge(m, dh)
+        for d in config.filter(obj_type='servicedependency'):
+            if not registered(d):
+                continue
+            masters = _hosts(d, 'host_name', 'hostgroup_name', groups)
+            dependents = _hosts(d, 'dependent_host_name',
+                    'dependent_hostgroup_name', groups)
+            services = split_list(d.get('service_description'))
+            dep_services = split_list(d.get('dependent_service_description',
+                d.get('dependent_description')))
+            for m in masters:
+                # dependent services are on the same host if not given
+                for dh in dependents or (m,):
+                    for s in services:
+                        for ds in dep_services:
+                            self.add_edge((m, s), (dh, ds))
+        if status is not None:
+            self.update_status(status)
+        else:
+            for s in config.filter(obj_type='service'):
+                if registered(s) and 'service_description' in s:
+                    for h in _hosts(s, 'host_name', 'hostgroup_name', groups):
+                        self.add_edge(h, (h, s['service_description']))
+
+    def update_status(self, status):
+        """
+        Link hosts to services of status: edges of services which are not in
+        status anymore are removed, edges of new services are added
+        """
+        services = set([ (s['host_name'], s['service_description'])
+            for s in status.filter(obj_type='servicestatus') ])
+        old = self.status_services or set()
+        for node in old - services:
+            self.remove_edge(node[0], node)
+        for node in services - old:
+            self.add_edge(node[0], node)
+        self.status_services = services
+
+    def _walk(self, nodes, edges, follow=None):
+        """
+        Return set of nodes reachable from nodes by edges (not including
+        nodes themselves unless reachable), only through nodes for which
+        follow(node) is true if it is given
+        """
+        seen = set()
+        queue = deque(nodes)
+        while queue:
+            n = queue.popleft()
+            for x in edges.get(n, ()):
+                if not x in seen and (follow is None or follow(x)):
+                    seen.add(x)
+                    queue.append(x)
+        return seen
+
+    def impact(self, *nodes):
+        """
+        Return set of nodes transitively depending on nodes
+        """
+        return self._walk(nodes, self.dependents)
+
+    def depends_on(self, *nodes):
+        """
+        Return set of nodes which nodes transitively depend on
+        """
+        return self._walk(nodes, self.masters)
+
+    def root_causes(self, node, status, failing=None):
+        """
+        Return set of failing nodes (by current_state in status) which node
+        depends on through failing nodes and which do not depend on other
+        failing nodes. If node fails and none of its masters fail, it is its
+        own root cause.
+        """
+        if failing is None:
+            failing = _failing(status)
+        chain = self._walk((node,), self.masters, failing.__contains__)
+        if node in failing:
+            chain.add(node)
+        masters = self.masters
+        return set([ n for n in chain
+            if not [ m for m in masters.get(n, ()) if m in failing ] ])
+
+    def problems(self, status):
+        """
+        Return dict root problem -> set of nodes it impacts, root problems are
+        failing nodes which do not depend on other failing nodes. Impacts of
+        all roots are found in one pass, node impacted by several roots is
+        given to the nearest one (impact gives everything behind one root)
+        """
+        failing = _failing(status)
+        masters = self.masters
+        dependents = self.dependents
+        roots = sorted([ n for n in failing
+            if not [ m for m in masters.get(n, ()) if m in failing ] ])
+        res = dict([ (r, set()) for r in roots ])
+        root_of = dict([ (r, r) for r in roots ])
+        queue = deque(roots)
+        while queue:
+            n = queue.popleft()
+            r = root_of[n]
+            for x in dependents.get(n, ()):
+                if not x in root_of:
+                    root_of[x] = r
+                    res[r].add(x)
+                    queue.append(x)
+        return res
+
+class DependencyGraphUpdates(object):
+    """
+    Mixin to NagData keeping dependency graph (self.dependency_graph) of
+    config, it is built on first use after config was loaded or updated,
+    links of hosts to their services are updated when status is replaced.
+    Should precede NagData in bases.
+    """
+    _dependency_graph = None
+
+    @property
+    def dependency_graph(self):
+        if self._dependency_graph is None:
+            self._dependency_graph = DependencyGraph(self.config, self.status)
+        return self._dependency_graph
+
+    def replace_config(self, main_cfg, cfg_objs):
+        super(DependencyGraphUpdates, self).replace_config(main_cfg, cfg_objs)
+        self._dependency_graph = None
+
+    def replace_main_config(self, cfg):
+        super(DependencyGraphUpdates, self).replace_main_config(cfg)
+        self._dependency_graph = None
+
+    def replace_config_file(self, filename, cfg_objs):
+        super(DependencyGraphUpdates, self).replace_config_file(filename,
+                cfg_objs)
+        self._dependency_graph = None
+
+    def replace_status(self, stat, ctime):
+        super(DependencyGraphUpdates, self).replace_status(stat, ctime)
+        if self._dependency_graph is not None:
+            self._dependency_graph.update_status(self.status)
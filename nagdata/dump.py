@@ -0,0 +1,250 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Streaming compact binary export and import of collections.
+
+Stream is magic 'NAGDUMP1' followed by frames, every frame is 4-byte
+little-endian length and marshalled data; frame of zero length ends stream.
+First frame is header (notags, obj_group) of collection, others are blocks of
+up to block_size objects:
+
+    (new schemas, objects)
+
+new schemas -- list of (obj_type, attribute names) appended to schema table
+               of stream, so attribute names are written once per schema
+objects     -- list of (schema number, __id, attribute values, format)
+
+Values keep their types (str, int, float, lists, tuples), group lists are
+written as {'groups': [group, ...]}. Short strings are interned before
+marshalling, so every block contains its own string table with each distinct
+value written once (and strings are shared by objects after reading).
+Neither writer nor reader needs more than one block in memory.
+"""
+
+import struct
+import marshal
+from itertools import izip
+
+from factory import NagiosFactory
+from collection import NagCollection
+from exceptions import NagDataError
+
+MAGIC = 'NAGDUMP1'
+FRAME_HEADER = struct.Struct('<I')
+# longer strings are not put into string table
+MAX_TABLE_STRING = 256
+
+class DumpError(NagDataError):
+    """
+    Stream is damaged or has unknown format
+    """
+    pass
+
+def _plain(v):
+    """
+    Convert attribute value to type which may be marshalled
+    """
+    if isinstance(v, str):
+        if len(v) <= MAX_TABLE_STRING:
+            return intern(str(v))
+        return str(v)
+    elif isinstance(v, (int, long, float)) or v is None:
+        return v
+    elif isinstance(v, unicode):
+        return _plain(v.encode('utf-8'))
+    elif isinstance(v, list) and hasattr(v, 'groups'):
+        return {'groups': [ _plain(list(g)) for g in v.groups ]}
+    elif isinstance(v, list):
+        return [ _plain(x) for x in v ]
+    elif isinstance(v, tuple):
+        return tuple([ _plain(x) for x in v ])
+    raise DumpError("Value of type '%s' can not be dumped" % type(v).__name__)
+
+class CollectionWriter(object):
+    """
+    Writes objects to file-like object f one by one
+    """
+
+    def __init__(self, f, notags=False, obj_group=None, block_size=1000):
+        """
+        f          -- file-like object opened for binary writing
+        notags     -- notags of collection to be created by reader
+        obj_group  -- obj_group of collection to be created by reader
+        block_size -- number of objects in one frame
+        """
+        self.f = f
+        self.block_size = block_size
+        # (obj_type, attribute names) -> schema number
+        self._schemas = {}
+        self._new_schemas = []
+        self._objects = []
+        f.write(MAGIC)
+        self._frame((bool(notags), obj_group))
+
+    def _frame(self, data):
+        s = marshal.dumps(data, 2)
+        self.f.write(FRAME_HEADER.pack(len(s)) + s)
+
+    def write(self, nagobj):
+        """
+        Write object
+        """
+        attrs = tuple([ intern(a) for a in nagobj
+                if a != 'obj_type' and a != '__id' ])
+        key = (nagobj.obj_type, attrs)
+        n = self._schemas.get(key)
+        if n is None:
+            n = self._schemas[key] = len(self._schemas)
+            self._new_schemas.append(key)
+        fmt = nagobj.fmt
+        if fmt is not None:
+            fmt = _plain(list(fmt))
+        self._objects.append((n, nagobj['__id'],
+            tuple([ _plain(nagobj[a]) for a in attrs ]), fmt))
+        if len(self._objects) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write objects collected so far as one block
+        """
+        if self._objects:
+            self._frame((self._new_schemas, self._objects))
+            self._new_schemas = []
+            self._objects = []
+
+    def close(self):
+        """
+        Write last block and end of stream (file itself is not closed)
+        """
+        self.flush()
+        self.f.write(FRAME_HEADER.pack(0))
+
+class CollectionReader(object):
+    """
+    Reads objects written by CollectionWriter from file-like object f.
+    Iterating over reader yields objects as they are read.
+    """
+
+    def __init__(self, f, factory=NagiosFactory):
+        self.f = f
+        self.factory = factory
+        # list of (class, attribute names, [(attribute index, attribute class)])
+        self._schemas = []
+        if f.read(len(MAGIC)) != MAGIC:
+            raise DumpError('Not a collection dump')
+        header = self._frame()
+        if header is None:
+            raise DumpError('Unexpected end of stream')
+        self.notags, self.obj_group = header
+
+    def _frame(self):
+        """
+        Return data of next frame or None at the end of stream
+        """
+        h = self.f.read(FRAME_HEADER.size)
+        if len(h) < FRAME_HEADER.size:
+            raise DumpError('Unexpected end of stream')
+        n = FRAME_HEADER.unpack(h)[0]
+        if not n:
+            return None
+        s = self.f.read(n)
+        if len(s) < n:
+            raise DumpError('Unexpected end of stream')
+        try:
+            return marshal.loads(s)
+        except (ValueError, EOFError, TypeError), e:
+            raise DumpError('Damaged frame: %s' % e)
+
+    def _add_schema(self, obj_type, attrs):
+        C = self.factory.obj_types.get(obj_type)
+        if C is None:
+            raise DumpError(
+                "Object type '%s' is not registered with factory" % obj_type)
+        typed = []
+        for i, a in enumerate(attrs):
+            attr_class = getattr(C, a, None)
+            if isinstance(attr_class, type) and issubclass(attr_class, list):
+                typed.append((i, attr_class))
+        self._schemas.append((C, attrs, typed))
+
+    def _object(self, C, attrs, typed, __id, values, fmt):
+        if typed:
+            values = list(values)
+            for i, attr_class in typed:
+                v = values[i]
+                if isinstance(v, dict):
+                    gl = attr_class()
+                    for g in v['groups']:
+                        gl.add(g)
+                    values[i] = gl
+                elif isinstance(v, list):
+                    values[i] = attr_class(v)
+        o = C.from_attrs(dict(izip(attrs, values)), __id)
+        o.fmt = fmt
+        return o
+
+    def blocks(self):
+        """
+        Iterate over blocks of stream, yields lists of objects
+        """
+        while True:
+            block = self._frame()
+            if block is None:
+                return
+            try:
+                new_schemas, objects = block
+                for obj_type, attrs in new_schemas:
+                    self._add_schema(obj_type, attrs)
+                schemas = self._schemas
+                yield [ self._object(*(schemas[n] + (__id, values, fmt)))
+                        for n, __id, values, fmt in objects ]
+            except (ValueError, TypeError, IndexError, KeyError), e:
+                raise DumpError('Damaged block: %s' % e)
+
+    def __iter__(self):
+        for objs in self.blocks():
+            for o in objs:
+                yield o
+
+    def collection(self):
+        """
+        Return collection of all objects left in stream, objects are indexed
+        block by block as they are read
+        """
+        coll = NagCollection(notags=self.notags, obj_group=self.obj_group)
+        for objs in self.blocks():
+            for o in objs:
+                coll.add(o)
+        return coll
+
+def dump(collection, f):
+    """
+    Write collection to file-like object f
+    """
+    w = CollectionWriter(f, collection.notags, collection._obj_group)
+    for o in collection:
+        w.write(o)
+    w.close()
+
+def load(f, factory=NagiosFactory):
+    """
+    Read collection from file-like object f
+    """
+    return CollectionReader(f, factory).collection()
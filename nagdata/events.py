@@ -0,0 +1,197 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Events about changes of status between status updates
+"""
+
+import operator
+from itertools import izip
+
+class StatusEvent(object):
+    """
+    Base class of status events, obj is status object event is about
+    """
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __repr__(self):
+        return "<%s %s(%s)>" % (self.__class__.__name__, self.obj.obj_type,
+                self.obj.pkey_repr())
+
+class ObjectAdded(StatusEvent):
+    """
+    New status object appeared (host, service, comment, ...)
+    """
+    pass
+
+class ObjectRemoved(StatusEvent):
+    """
+    Status object disappeared, obj is object from previous status
+    """
+    pass
+
+class AttributeChanged(StatusEvent):
+    """
+    Watched attribute of hoststatus or servicestatus changed from old to new
+    """
+    # attribute which is watched
+    attr = None
+
+    def __init__(self, obj, old, new):
+        super(AttributeChanged, self).__init__(obj)
+        self.old = old
+        self.new = new
+
+    @classmethod
+    def changed(cls, old, new):
+        """
+        Whether change of attribute from old to new produces event
+        """
+        return old != new
+
+    def __repr__(self):
+        return "<%s %s(%s) %s: %r -> %r>" % (self.__class__.__name__,
+                self.obj.obj_type, self.obj.pkey_repr(), self.attr,
+                self.old, self.new)
+
+class StateChanged(AttributeChanged):
+    attr = 'current_state'
+
+class StateTypeChanged(AttributeChanged):
+    attr = 'state_type'
+
+class AcknowledgementChanged(AttributeChanged):
+    attr = 'problem_has_been_acknowledged'
+
+class FlappingChanged(AttributeChanged):
+    attr = 'is_flapping'
+
+class DowntimeChanged(AttributeChanged):
+    """
+    Object entered or left scheduled downtime
+    """
+    attr = 'scheduled_downtime_depth'
+
+    @classmethod
+    def changed(cls, old, new):
+        return (old in (None, 0, '0')) != (new in (None, 0, '0'))
+
+# events produced by changes of watched attributes
+CHANGE_EVENTS = [StateChanged, StateTypeChanged, AcknowledgementChanged,
+        FlappingChanged, DowntimeChanged]
+# obj_type -> attributes to watch
+WATCHED = {
+    'hoststatus': tuple([ e.attr for e in CHANGE_EVENTS ]),
+    'servicestatus': tuple([ e.attr for e in CHANGE_EVENTS ]),
+}
+
+_get_id = operator.itemgetter('__id')
+
+def status_state(status, factory):
+    """
+    Return state of status collection to compare with next one: obj_type ->
+    dict __id -> tuple of watched attributes. Only objects with primary key
+    are tracked, others get new __id every time status is loaded.
+    """
+    state = {}
+    for obj_type, objs in status.tags.get('obj_type', {}).items():
+        C = factory.obj_types.get(obj_type)
+        if C is None or C.pkey is None:
+            continue
+        attrs = WATCHED.get(obj_type, ())
+        ids = map(_get_id, objs)
+        if attrs:
+            try:
+                values = map(operator.itemgetter(*attrs), objs)
+            except KeyError:
+                values = [ tuple([ o.get(a) for a in attrs ]) for o in objs ]
+        else:
+            values = [ None ] * len(ids)
+        state[obj_type] = dict(izip(ids, values))
+    return state
+
+def status_events(old_status, old_state, new_status, new_state):
+    """
+    Return list of events between old and new status collections given their
+    states (see status_state). Comparison is done with set operations on
+    states, so only changed objects are handled one by one.
+    """
+    events = []
+    for obj_type in set(old_state) | set(new_state):
+        old = old_state.get(obj_type, {})
+        new = new_state.get(obj_type, {})
+        for i in old.viewkeys() - new.viewkeys():
+            for o in old_status.filter(__id=i):
+                events.append(ObjectRemoved(o))
+        for i, v in set(new.viewitems()) - set(old.viewitems()):
+            o = new_status.filter(__id=i)
+            if not o:
+                continue
+            o = o.pop()
+            if not i in old:
+                events.append(ObjectAdded(o))
+                continue
+            ov = old[i]
+            for k, e in enumerate(CHANGE_EVENTS):
+                if e.changed(ov[k], v[k]):
+                    events.append(e(o, ov[k], v[k]))
+    return events
+
+class StatusEvents(object):
+    """
+    Mixin to NagData to receive events about status changes on every status
+    update. Should precede NagData (and OnUpdateCallbacks) in bases. Subscribe
+    with subscribe(callback, *event_classes), callback is called with every
+    event. State is compared only while there are subscribers.
+    """
+    _status_state = None
+
+    def subscribe(self, callback, *event_classes):
+        """
+        Call callback(event) for every event which is instance of one of
+        event_classes (or for every event if none given)
+        """
+        self.__dict__.setdefault('_subscribers', []).append(
+                (callback, event_classes or (StatusEvent,)))
+
+    def unsubscribe(self, callback):
+        self._subscribers = [ (c, e)
+                for c, e in self.__dict__.get('_subscribers', [])
+                    if c != callback ]
+
+    def replace_status(self, stat, ctime):
+        subscribers = self.__dict__.get('_subscribers')
+        if not subscribers:
+            self._status_state = None
+            super(StatusEvents, self).replace_status(stat, ctime)
+            return
+        old = self.status
+        if self._status_state is None or self._status_state[0] is not old:
+            old_state = status_state(old, self.factory)
+        else:
+            old_state = self._status_state[1]
+        new_state = status_state(stat, self.factory)
+        events = status_events(old, old_state, stat, new_state)
+        super(StatusEvents, self).replace_status(stat, ctime)
+        self._status_state = (stat, new_state)
+        for e in events:
+            for callback, event_classes in subscribers:
+                if isinstance(e, event_classes):
+                    callback(e)
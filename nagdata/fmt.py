@@ -41,6 +41,15 @@ class __fmt__(dict):
         self.fmt = fmt
         return self
 
+    @classmethod
+    def from_attrs(cls, attrs, __id=None):
+        self = cls()
+        self.update(attrs)
+        if __id is not None:
+            self.__id = __id
+            self['__id'] = __id
+        return self
+
     def __init__(self):
         self.__id = object.__hash__(self)
         self['obj_type'] = self.obj_type
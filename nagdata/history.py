@@ -0,0 +1,186 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Compact history of status objects over last status updates
+"""
+
+from array import array
+from collections import deque
+
+# value of numeric column meaning that object was absent or had no value,
+# maximum value for unsigned types (0 is valid value, e.g. last_check of
+# object which was never checked)
+MISSING = {'b': -1, 'h': -1, 'i': -1, 'l': -1, 'f': -1, 'd': -1}
+for _tc in 'BHIL':
+    MISSING[_tc] = (1 << 8 * array(_tc).itemsize) - 1
+del _tc
+
+class StatusHistory(object):
+    """
+    Ring buffer of last size snapshots of some attributes of status objects.
+    Every object gets row number by its __id. Numeric attributes are kept in
+    arrays (one per snapshot and attribute, indexed by row), string
+    attributes are kept as changes (row -> value) since previous snapshot,
+    oldest snapshot keeps all values. History of one object is collected in
+    O(size).
+    """
+
+    def __init__(self, size=100, obj_types=('hoststatus', 'servicestatus'),
+            numeric=(('current_state', 'b'), ('last_check', 'I')),
+            strings=('performance_data',)):
+        """
+        size      -- number of snapshots to keep
+        obj_types -- types of objects to keep history of
+        numeric   -- (attribute, array typecode) of numeric attributes
+        strings   -- string attributes
+        """
+        self.size = size
+        self.obj_types = obj_types
+        self.numeric = tuple(numeric)
+        self.strings = tuple(strings)
+        # __id -> row
+        self._rows = {}
+        # (timestamp, {attr: array}, {attr: {row: value}})
+        self._snapshots = deque()
+        # attr -> {row: last value}
+        self._last = dict([ (a, {}) for a in self.strings ])
+
+    def _objects(self, status):
+        objs = []
+        by_type = status.tags.get('obj_type', {})
+        for t in self.obj_types:
+            objs.extend(by_type.get(t, ()))
+        return objs
+
+    def add(self, status, timestamp=0):
+        """
+        Add snapshot of status collection taken at timestamp
+        """
+        rows = self._rows
+        objs = self._objects(status)
+        obj_rows = []
+        for o in objs:
+            i = o['__id']
+            r = rows.get(i)
+            if r is None:
+                r = rows[i] = len(rows)
+            obj_rows.append(r)
+        n = len(rows)
+        columns = {}
+        for a, tc in self.numeric:
+            col = columns[a] = array(tc, [MISSING[tc]]) * n
+            conv = tc in 'fd' and float or int
+            for o, r in zip(objs, obj_rows):
+                v = o.get(a)
+                if v is None or v == '':
+                    continue
+                try:
+                    col[r] = conv(v)
+                except (ValueError, OverflowError):
+                    pass
+        changes = {}
+        for a in self.strings:
+            last = self._last[a]
+            ch = changes[a] = {}
+            seen = set()
+            for o, r in zip(objs, obj_rows):
+                v = o.get(a)
+                seen.add(r)
+                if last.get(r) != v:
+                    ch[r] = last[r] = v
+            # objects which disappeared
+            for r in set(last) - seen:
+                if not last[r] is None:
+                    ch[r] = last[r] = None
+        if len(self._snapshots) >= self.size:
+            old = self._snapshots.popleft()
+            if self._snapshots:
+                # oldest snapshot keeps all values of string attributes
+                for a, ch in old[2].items():
+                    nxt = self._snapshots[0][2][a]
+                    for r, v in ch.iteritems():
+                        if not r in nxt:
+                            nxt[r] = v
+        self._snapshots.append((timestamp, columns, changes))
+
+    def history(self, obj):
+        """
+        Return history of object (or its __id): list of (timestamp, values)
+        from oldest to newest snapshot, values is dict attr -> value (None if
+        object was absent or had no value)
+        """
+        if isinstance(obj, dict):
+            obj = obj['__id']
+        r = self._rows.get(obj)
+        res = []
+        if r is None:
+            return res
+        cur = dict([ (a, None) for a in self.strings ])
+        for ts, columns, changes in self._snapshots:
+            values = {}
+            for a, tc in self.numeric:
+                col = columns[a]
+                if r < len(col) and col[r] != MISSING[tc]:
+                    values[a] = col[r]
+                else:
+                    values[a] = None
+            for a in self.strings:
+                if r in changes[a]:
+                    cur[a] = changes[a][r]
+                values[a] = cur[a]
+            res.append((ts, values))
+        return res
+
+    def values(self, obj, attr):
+        """
+        Return list of values of attr of object over snapshots (e.g. states for
+        sparkline)
+        """
+        return [ v[attr] for ts, v in self.history(obj) ]
+
+    def timestamps(self):
+        """
+        Return timestamps of kept snapshots
+        """
+        return [ s[0] for s in self._snapshots ]
+
+    def __len__(self):
+        return len(self._snapshots)
+
+class KeepStatusHistory(object):
+    """
+    Mixin to NagData to keep history of status objects in
+    self.status_history, which is fed on every status update. Should precede
+    NagData in bases. history_size defines how many updates to keep.
+    """
+    history_size = 100
+    _status_history = None
+
+    @property
+    def status_history(self):
+        if self._status_history is None:
+            self._status_history = StatusHistory(self.history_size)
+        return self._status_history
+
+    def replace_status(self, stat, ctime):
+        if self._status_history is None and 'status' in self.__dict__:
+            # status loaded at start
+            self.status_history.add(self.status, self.status_ctime)
+        super(KeepStatusHistory, self).replace_status(stat, ctime)
+        self.status_history.add(stat, ctime)
@@ -0,0 +1,464 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Index of services applying to hosts.
+
+Service definition applies to hosts listed in its host_name and to members of
+hostgroups listed in its hostgroup_name (effective values, with templates
+resolved). Names may be wildcards ('*', '?', '[...]'), names starting with '!'
+are excluded. Members of hostgroup are its members, hosts listing it in their
+hostgroups and members of its hostgroup_members. If several definitions of
+the same service_description apply to host, one listing host in host_name
+wins over one applying through hostgroup.
+
+    idx = hostservices.HostServiceIndex(n.config)
+    idx.services('web1')          # {service_description: service}
+    idx.hosts(service)            # set of host names
+"""
+
+import fnmatch
+
+from depgraph import split_list, registered
+from inherit import TemplateResolver
+from model import NagObj
+
+def is_pattern(name):
+    """
+    Check if name is wildcard
+    """
+    return '*' in name or '?' in name or '[' in name
+
+class HostServiceIndex(object):
+    """
+    Materialized index host -> services applying to it, maintained on update
+    """
+
+    def __init__(self, config, resolver=None):
+        """
+        config   -- config collection
+        resolver -- TemplateResolver of config (index creates its own and
+                    keeps it up to date on update if it is not given)
+        """
+        self.config = config
+        self._own_resolver = resolver is None
+        if resolver is None:
+            resolver = TemplateResolver(config)
+        self.resolver = resolver
+        self.clear()
+
+    def clear(self):
+        """
+        Build index again
+        """
+        # host __id -> (host_name, hostgroups) of registered hosts
+        self._host_objs = {}
+        # hostgroup __id -> (hostgroup_name, members, hostgroup_members)
+        self._group_objs = {}
+        # host_name -> ids of hosts defining it
+        self._host_ids = {}
+        # hostgroup_name -> ids of hostgroups defining it
+        self._group_ids = {}
+        # hostgroup_name -> ids of hosts listing it in hostgroups
+        self._listed_by = {}
+        # name -> ids of hostgroups listing it in members
+        self._member_ref = {}
+        # hostgroup_name -> ids of hostgroups listing it in hostgroup_members
+        self._nested_by = {}
+        # registered host names, hostgroup_name -> set of host names
+        self._hosts = set()
+        self._groups = {}
+        hosts = {}
+        for o in self.config.filter(obj_type='host'):
+            self._add_member(o, hosts)
+        for o in self.config.filter(obj_type='hostgroup'):
+            self._add_member(o, hosts)
+        for g in set(self._group_ids) | set(self._listed_by):
+            self._groups[g] = self._group_hosts_of(g)
+        # service __id -> (service, service_description, hosts: {host_name:
+        # priority}, referenced host names, referenced groups, has wildcards)
+        self._services = {}
+        # host_name -> ids of services naming it in host_name
+        self._by_host_ref = {}
+        # hostgroup_name -> ids of services naming it in hostgroup_name
+        self._by_group_ref = {}
+        # ids of services with wildcards
+        self._patterns = set()
+        # host_name -> service_description -> {service __id: priority}
+        self._index = {}
+        for o in self.config.filter(obj_type='service'):
+            self._add_service(o)
+
+    def _add_member(self, nagobj, hosts):
+        """
+        Index registered host or hostgroup, returns names of hostgroups whose
+        members it changes. hosts is dict host_name -> whether it existed
+        before update, updated for host names added.
+        """
+        if not isinstance(nagobj, NagObj) or not registered(nagobj):
+            return ()
+        i = nagobj['__id']
+        e = self.resolver.effective(nagobj)
+        if nagobj.obj_type == 'host' and 'host_name' in e:
+            name = e['host_name']
+            groups = tuple(split_list(e.get('hostgroups')))
+            self._host_objs[i] = (name, groups)
+            hosts.setdefault(name, name in self._host_ids)
+            self._host_ids.setdefault(name, set()).add(i)
+            self._hosts.add(name)
+            for g in groups:
+                self._listed_by.setdefault(g, set()).add(i)
+            return groups
+        if nagobj.obj_type == 'hostgroup' and 'hostgroup_name' in e:
+            name = e['hostgroup_name']
+            members = tuple(split_list(e.get('members')))
+            nested = tuple(split_list(e.get('hostgroup_members')))
+            self._group_objs[i] = (name, members, nested)
+            self._group_ids.setdefault(name, set()).add(i)
+            for m in members:
+                self._member_ref.setdefault(m, set()).add(i)
+            for g in nested:
+                self._nested_by.setdefault(g, set()).add(i)
+            return (name,)
+        return ()
+
+    def _remove_member(self, i, hosts):
+        """
+        Forget indexed host or hostgroup by __id, returns names of hostgroups
+        whose members it changes (see _add_member)
+        """
+        def discard(refs, key):
+            ids = refs.get(key)
+            if ids is not None:
+                ids.discard(i)
+                if not ids:
+                    del refs[key]
+        entry = self._host_objs.pop(i, None)
+        if entry is not None:
+            name, groups = entry
+            hosts.setdefault(name, True)
+            discard(self._host_ids, name)
+            if not name in self._host_ids:
+                self._hosts.discard(name)
+            for g in groups:
+                discard(self._listed_by, g)
+            return groups
+        entry = self._group_objs.pop(i, None)
+        if entry is not None:
+            name, members, nested = entry
+            discard(self._group_ids, name)
+            for m in members:
+                discard(self._member_ref, m)
+            for g in nested:
+                discard(self._nested_by, g)
+            return (name,)
+        return ()
+
+    def _with_parents(self, names):
+        """
+        Return set of hostgroup names and names of hostgroups including them
+        (through any number of hostgroup_members)
+        """
+        res = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name in res:
+                continue
+            res.add(name)
+            for i in self._nested_by.get(name, ()):
+                stack.append(self._group_objs[i][0])
+        return res
+
+    def _members(self, name, resolving):
+        res = set()
+        for i in self._listed_by.get(name, ()):
+            res.add(self._host_objs[i][0])
+        resolving.add(name)
+        for i in self._group_ids.get(name, ()):
+            g, members, nested = self._group_objs[i]
+            res.update(members)
+            for sub in nested:
+                if not sub in resolving:
+                    res.update(self._members(sub, resolving))
+        resolving.discard(name)
+        return res
+
+    def _group_hosts_of(self, name):
+        """
+        Return set of host names of hostgroup, None if it is not defined
+        """
+        if not name in self._group_ids and not name in self._listed_by:
+            return None
+        m = self._members(name, set())
+        if '*' in m:
+            return set(self._hosts)
+        m.intersection_update(self._hosts)
+        return m
+
+    def _group_hosts(self, names):
+        hosts = set()
+        for n in names:
+            if is_pattern(n):
+                for g in fnmatch.filter(self._groups, n):
+                    hosts.update(self._groups[g])
+            else:
+                hosts.update(self._groups.get(n, ()))
+        return hosts
+
+    def _applies(self, e):
+        """
+        Return (hosts: {host_name: priority}, referenced host names,
+        referenced groups, has wildcards) of effective service attributes
+        """
+        host_names = split_list(e.get('host_name'))
+        group_names = split_list(e.get('hostgroup_name'))
+        hrefs = set([ n.lstrip('!') for n in host_names ])
+        grefs = set([ n.lstrip('!') for n in group_names ])
+        pattern = bool([ n for n in hrefs | grefs if is_pattern(n) ])
+        hosts = {}
+        for h in self._group_hosts([ n for n in group_names
+                if not n.startswith('!') ]):
+            hosts[h] = 0
+        for n in host_names:
+            if n.startswith('!'):
+                continue
+            if is_pattern(n):
+                for h in fnmatch.filter(self._hosts, n):
+                    hosts[h] = 1
+            elif n in self._hosts:
+                hosts[n] = 1
+        excluded = self._group_hosts([ n[1:] for n in group_names
+            if n.startswith('!') ])
+        for n in host_names:
+            if n.startswith('!'):
+                if is_pattern(n):
+                    excluded.update(fnmatch.filter(self._hosts, n[1:]))
+                else:
+                    excluded.add(n[1:])
+        for h in excluded:
+            hosts.pop(h, None)
+        return hosts, hrefs, grefs, pattern
+
+    def _add_service(self, service):
+        if not isinstance(service, NagObj) or service.obj_type != 'service' \
+                or not registered(service):
+            return
+        i = service['__id']
+        e = self.resolver.effective(service)
+        desc = e.get('service_description')
+        if not desc:
+            return
+        hosts, hrefs, grefs, pattern = self._applies(e)
+        self._services[i] = (service, desc, hosts, hrefs, grefs, pattern)
+        for h in hrefs:
+            self._by_host_ref.setdefault(h, set()).add(i)
+        for g in grefs:
+            self._by_group_ref.setdefault(g, set()).add(i)
+        if pattern:
+            self._patterns.add(i)
+        index = self._index
+        for h, p in hosts.iteritems():
+            index.setdefault(h, {}).setdefault(desc, {})[i] = p
+
+    def _remove_service(self, i):
+        entry = self._services.pop(i, None)
+        if entry is None:
+            return
+        service, desc, hosts, hrefs, grefs, pattern = entry
+        for refs, names in ((self._by_host_ref, hrefs),
+                (self._by_group_ref, grefs)):
+            for n in names:
+                ids = refs.get(n)
+                if ids is not None:
+                    ids.discard(i)
+                    if not ids:
+                        del refs[n]
+        self._patterns.discard(i)
+        index = self._index
+        for h in hosts:
+            descs = index[h]
+            defs = descs[desc]
+            del defs[i]
+            if not defs:
+                del descs[desc]
+                if not descs:
+                    del index[h]
+
+    def services(self, host_name):
+        """
+        Return dict service_description -> service definition applying to host
+        """
+        res = {}
+        for desc, defs in self._index.get(host_name, {}).iteritems():
+            i = max(defs, key=lambda i: (defs[i], -i))
+            res[desc] = self._services[i][0]
+        return res
+
+    def hosts(self, service):
+        """
+        Return set of host names service definition applies to
+        """
+        entry = self._services.get(service['__id'])
+        if entry is None:
+            return set()
+        return set(entry[2])
+
+    def group_hosts(self, hostgroup_name):
+        """
+        Return set of members of hostgroup
+        """
+        return set(self._groups.get(hostgroup_name, ()))
+
+    def update(self, old, new):
+        """
+        Replace objects old with new (e.g. objects of reloaded file), only
+        services which are changed, inherit from changed templates or refer
+        to hosts and hostgroups whose membership changed are expanded again
+        """
+        resolver = self.resolver
+        affected = set()
+        for o in old:
+            if isinstance(o, NagObj):
+                affected.add(o['__id'])
+                affected.update(resolver.descendants(o))
+        if self._own_resolver:
+            resolver.update(old, new)
+        for o in new:
+            if isinstance(o, NagObj):
+                affected.add(o['__id'])
+                affected.update(resolver.descendants(o))
+        # changed hosts and hostgroups, groups including touched groups are
+        # found after update (nesting removed is in touched group itself)
+        members = [ i for i in affected if i in self._host_objs
+            or i in self._group_objs or getattr(resolver.get_object(i),
+                'obj_type', None) in ('host', 'hostgroup') ]
+        hosts = {}
+        touched = set()
+        for i in members:
+            touched.update(self._remove_member(i, hosts))
+        for i in members:
+            o = resolver.get_object(i)
+            if o is not None:
+                touched.update(self._add_member(o, hosts))
+        changed_hosts = set([ h for h, existed in hosts.iteritems()
+            if existed != (h in self._host_ids) ])
+        if changed_hosts:
+            # groups listing hosts which appeared or disappeared in members
+            for h in changed_hosts | set(['*']):
+                for i in self._member_ref.get(h, ()):
+                    touched.add(self._group_objs[i][0])
+        changed_groups = set()
+        for g in self._with_parents(touched):
+            m = self._group_hosts_of(g)
+            if m != self._groups.get(g):
+                changed_groups.add(g)
+                if m is None:
+                    del self._groups[g]
+                else:
+                    self._groups[g] = m
+        todo = set([ i for i in affected if i in self._services
+            or getattr(resolver.get_object(i), 'obj_type', None) == 'service' ])
+        for h in changed_hosts:
+            todo.update(self._by_host_ref.get(h, ()))
+        for g in changed_groups:
+            todo.update(self._by_group_ref.get(g, ()))
+        if changed_hosts or changed_groups:
+            todo.update(self._patterns)
+        for i in todo:
+            self._remove_service(i)
+            o = resolver.get_object(i)
+            if o is not None:
+                self._add_service(o)
+        return todo
+
+class HostServiceIndexUpdates(object):
+    """
+    Mixin to NagData keeping index of services applying to hosts
+    (self.host_services), updated incrementally on update_config_file and
+    built again when whole config is replaced, objects created by new,
+    removed by remove and objects of file saved by save are indexed again.
+    getall('service', host_name=...) uses it, so it also finds services
+    applying to host through hostgroups, lists and wildcards. Should precede
+    NagData in bases.
+    """
+    _host_services = None
+
+    @property
+    def host_services(self):
+        if self._host_services is None:
+            self._host_services = HostServiceIndex(self.config)
+        return self._host_services
+
+    def getall(self, obj_type, **tags):
+        # services naming host in host_name are found as without index too,
+        # including ones the index has not seen yet (e.g. changed in memory)
+        res = super(HostServiceIndexUpdates, self).getall(obj_type, **tags)
+        if obj_type != 'service' or not 'host_name' in tags:
+            return res
+        idx = self.host_services
+        tags = dict(tags)
+        host = tags.pop('host_name')
+        config = self.config
+        for s in idx.services(host).itervalues():
+            if not s in config:
+                continue
+            e = idx.resolver.effective(s)
+            for k, v in tags.iteritems():
+                if (k in e and e[k] or s.get(k)) != v:
+                    break
+            else:
+                res.add(s)
+        return res
+
+    def new(self, obj_type, **kw):
+        o = super(HostServiceIndexUpdates, self).new(obj_type, **kw)
+        if self._host_services is not None:
+            self._host_services.update([], [o])
+        return o
+
+    def remove(self, nagobj):
+        super(HostServiceIndexUpdates, self).remove(nagobj)
+        if self._host_services is not None:
+            self._host_services.update([nagobj], [])
+
+    def save(self, nagobj, filename=None):
+        super(HostServiceIndexUpdates, self).save(nagobj, filename)
+        if self._host_services is not None:
+            # objects of file may have been changed in memory before saving
+            objs = list(self.config.filter(__filename=nagobj['__filename']))
+            self._host_services.update(objs, objs)
+
+    def replace_config(self, main_cfg, cfg_objs):
+        super(HostServiceIndexUpdates, self).replace_config(main_cfg,
+                cfg_objs)
+        self._host_services = None
+
+    def replace_main_config(self, cfg):
+        super(HostServiceIndexUpdates, self).replace_main_config(cfg)
+        self._host_services = None
+
+    def replace_config_file(self, filename, cfg_objs):
+        if self._host_services is None:
+            super(HostServiceIndexUpdates, self).replace_config_file(filename,
+                    cfg_objs)
+            return
+        old = list(self.config.filter(__filename=filename))
+        super(HostServiceIndexUpdates, self).replace_config_file(filename,
+                cfg_objs)
+        self._host_services.update(old, list(cfg_objs))
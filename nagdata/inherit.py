@@ -0,0 +1,229 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Resolution of template inheritance (use, name) as Nagios does it.
+
+Effective attributes of object are its own attributes over attributes
+inherited from templates listed in use, first template listed takes
+precedence. Value starting with '+' is added to inherited value, value 'null'
+is not inherited. name, register and use are not inherited. Effective
+attributes are cached until object or one of its templates is invalidated:
+
+    r = inherit.TemplateResolver(n.config)
+    h = n.get('host', host_name='router1')
+    r.effective(h)['check_command']
+"""
+
+from depgraph import split_list
+from model import NagObj
+
+# attributes which are not inherited from templates
+NOT_INHERITED = set(['name', 'register', 'use'])
+
+class TemplateResolver(object):
+    """
+    Computes and caches effective attributes of objects of config collection
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.clear()
+
+    def clear(self):
+        """
+        Forget everything and index config again
+        """
+        # __id -> object
+        self._objects = {}
+        # (obj_type, name) -> template
+        self._templates = {}
+        # (obj_type, name) -> set of __id of objects using template directly
+        self._children = {}
+        # __id -> effective attributes
+        self._cache = {}
+        for o in self.config:
+            self._add(o)
+
+    def _add(self, nagobj):
+        if not isinstance(nagobj, NagObj):
+            # formats and nagios.cfg
+            return
+        i = nagobj['__id']
+        self._objects[i] = nagobj
+        if 'name' in nagobj:
+            self._templates[(nagobj.obj_type, nagobj['name'])] = nagobj
+        for t in split_list(nagobj.get('use')):
+            self._children.setdefault((nagobj.obj_type, t), set()).add(i)
+
+    def _remove(self, nagobj):
+        if not isinstance(nagobj, NagObj):
+            return
+        i = nagobj['__id']
+        if self._objects.get(i) is nagobj:
+            del self._objects[i]
+        key = (nagobj.obj_type, nagobj.get('name'))
+        if self._templates.get(key) is nagobj:
+            del self._templates[key]
+        for t in split_list(nagobj.get('use')):
+            children = self._children.get((nagobj.obj_type, t))
+            if children is not None:
+                children.discard(i)
+                if not children:
+                    del self._children[(nagobj.obj_type, t)]
+
+    def get_object(self, __id):
+        """
+        Return indexed object by __id, None if there is no such object
+        """
+        return self._objects.get(__id)
+
+    def templates(self, nagobj):
+        """
+        Return templates used by object directly, in order of precedence
+        (missing templates are skipped)
+        """
+        res = []
+        for t in split_list(nagobj.get('use')):
+            tmpl = self._templates.get((nagobj.obj_type, t))
+            if tmpl is not None:
+                res.append(tmpl)
+        return res
+
+    def _resolve(self, nagobj, resolving):
+        i = nagobj['__id']
+        eff = self._cache.get(i)
+        if eff is not None:
+            return eff
+        resolving.add(i)
+        inherited = {}
+        # first template takes precedence, so it is applied last
+        for t in reversed(self.templates(nagobj)):
+            if t['__id'] in resolving:
+                # circular use
+                continue
+            inherited.update(self._resolve(t, resolving))
+        resolving.discard(i)
+        eff = dict([ (a, v) for a, v in inherited.iteritems()
+            if not a in NOT_INHERITED ])
+        for a, v in nagobj.fields():
+            if isinstance(v, basestring) and v.startswith('+'):
+                base = eff.get(a)
+                if base:
+                    v = '%s,%s' % (base, v[1:])
+                else:
+                    v = v[1:]
+            eff[a] = v
+        for a, v in eff.items():
+            if v == 'null':
+                del eff[a]
+        self._cache[i] = eff
+        return eff
+
+    def effective(self, nagobj):
+        """
+        Return dict of effective attributes of object (it should not be
+        changed)
+        """
+        return self._resolve(nagobj, set())
+
+    def resolve_all(self):
+        """
+        Compute effective attributes of all objects
+        """
+        for o in self._objects.values():
+            self._resolve(o, set())
+
+    def descendants(self, nagobj):
+        """
+        Return set of __id of objects inheriting from object (through any
+        number of templates)
+        """
+        res = set()
+        stack = [nagobj]
+        while stack:
+            o = stack.pop()
+            if not 'name' in o:
+                continue
+            for i in self._children.get((o.obj_type, o['name']), ()):
+                if not i in res:
+                    res.add(i)
+                    child = self._objects.get(i)
+                    if child is not None:
+                        stack.append(child)
+        return res
+
+    def invalidate(self, nagobj):
+        """
+        Forget effective attributes of object and its descendants (call it
+        when object changes)
+        """
+        self._cache.pop(nagobj['__id'], None)
+        for i in self.descendants(nagobj):
+            self._cache.pop(i, None)
+
+    def update(self, old, new):
+        """
+        Replace objects old with new (e.g. objects of reloaded file), only
+        they and descendants of changed templates are invalidated
+        """
+        for o in old:
+            self.invalidate(o)
+            self._remove(o)
+        for o in new:
+            self._add(o)
+            self.invalidate(o)
+
+class TemplateResolverUpdates(object):
+    """
+    Mixin to NagData keeping template resolver (self.templates) of config.
+    update_config_file invalidates only objects of file and their descendants,
+    it is created again when whole config is replaced. Should precede NagData
+    in bases.
+    """
+    _template_resolver = None
+
+    @property
+    def templates(self):
+        if self._template_resolver is None:
+            self._template_resolver = TemplateResolver(self.config)
+        return self._template_resolver
+
+    def effective(self, nagobj):
+        """
+        Return effective attributes of object (see TemplateResolver)
+        """
+        return self.templates.effective(nagobj)
+
+    def replace_config(self, main_cfg, cfg_objs):
+        super(TemplateResolverUpdates, self).replace_config(main_cfg, cfg_objs)
+        self._template_resolver = None
+
+    def replace_main_config(self, cfg):
+        super(TemplateResolverUpdates, self).replace_main_config(cfg)
+        self._template_resolver = None
+
+    def replace_config_file(self, filename, cfg_objs):
+        if self._template_resolver is None:
+            super(TemplateResolverUpdates, self).replace_config_file(filename,
+                    cfg_objs)
+            return
+        old = list(self.config.filter(__filename=filename))
+        super(TemplateResolverUpdates, self).replace_config_file(filename,
+                cfg_objs)
+        self._template_resolver.update(old, list(cfg_objs))
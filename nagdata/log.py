@@ -0,0 +1,435 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Nagios log: object keeping log records and incremental reader of nagios.log
+"""
+
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+from factory import NagiosFactory
+from parser import LogParser
+import model
+
+# size of one read from log file
+READ_CHUNK = 65536
+
+# messages of Nagios reload and startup
+RELOAD_MESSAGES = ('Caught SIGHUP, restarting...',)
+starting_re = re.compile('^Nagios .+ starting\.\.\.')
+
+def is_reload(msg):
+    """
+    Check if log message is about Nagios reload or startup
+    """
+    return msg in RELOAD_MESSAGES or starting_re.match(msg) is not None
+
+# event type -> fields of message after 'EVENT TYPE: ', separated by ';'
+# (last field takes rest of message)
+EVENT_FIELDS = {
+    'SERVICE ALERT': ('host_name', 'service_description', 'state',
+        'state_type', 'attempt', 'output'),
+    'HOST ALERT': ('host_name', 'state', 'state_type', 'attempt', 'output'),
+    'CURRENT SERVICE STATE': ('host_name', 'service_description', 'state',
+        'state_type', 'attempt', 'output'),
+    'CURRENT HOST STATE': ('host_name', 'state', 'state_type', 'attempt',
+        'output'),
+    'INITIAL SERVICE STATE': ('host_name', 'service_description', 'state',
+        'state_type', 'attempt', 'output'),
+    'INITIAL HOST STATE': ('host_name', 'state', 'state_type', 'attempt',
+        'output'),
+    'SERVICE NOTIFICATION': ('contact_name', 'host_name',
+        'service_description', 'state', 'command_name', 'output'),
+    'HOST NOTIFICATION': ('contact_name', 'host_name', 'state',
+        'command_name', 'output'),
+    'EXTERNAL COMMAND': ('command_name', 'args'),
+    'SERVICE DOWNTIME ALERT': ('host_name', 'service_description', 'state',
+        'comment'),
+    'HOST DOWNTIME ALERT': ('host_name', 'state', 'comment'),
+    'SERVICE FLAPPING ALERT': ('host_name', 'service_description', 'state',
+        'comment'),
+    'HOST FLAPPING ALERT': ('host_name', 'state', 'comment'),
+}
+event_re = re.compile('([A-Z ]+): ')
+# event type -> (position of host_name, position of service_description)
+_KEY_FIELDS = dict([ (t, ('host_name' in f and f.index('host_name'),
+    'service_description' in f and f.index('service_description')))
+    for t, f in EVENT_FIELDS.items() if 'host_name' in f ])
+
+class LogEvent(dict):
+    """
+    Typed log record: 'timestamp', 'event_type' and fields of event type
+    (see EVENT_FIELDS), 'attempt' is integer
+    """
+
+def parse_event(ts, msg):
+    """
+    Return LogEvent for message of known type, None otherwise
+    """
+    m = event_re.match(msg)
+    if not m:
+        return None
+    fields = EVENT_FIELDS.get(m.group(1))
+    if fields is None:
+        return None
+    event_type = m.group(1)
+    values = msg[m.end():].split(';', len(fields) - 1)
+    if len(values) < len(fields):
+        values.extend([''] * (len(fields) - len(values)))
+    ev = LogEvent(zip(fields, values))
+    ev['timestamp'] = ts
+    ev['event_type'] = event_type
+    if 'attempt' in ev:
+        try:
+            ev['attempt'] = int(ev['attempt'])
+        except ValueError:
+            pass
+    return ev
+
+class LogStore(object):
+    """
+    Time-sorted store of log records (timestamp, message), timestamps are
+    integers. Records are kept compactly: timestamps in array and messages in
+    single buffer with arrays of their offsets and lengths. Reload and startup
+    records are also indexed separately. Records with timestamp older than
+    last one are inserted at their place in time, records with timestamp
+    which is not integer are skipped.
+
+    Records of known event types (see EVENT_FIELDS) are indexed by event type,
+    host and service, events() returns them as LogEvent.
+    """
+
+    def __init__(self, records=()):
+        self.times = array('l')
+        self._starts = array('L')
+        self._lens = array('L')
+        self._text = bytearray()
+        # timestamps of reload and startup records
+        self.reloads = array('l')
+        # number of records removed by trim, indexes below keep positions of
+        # records plus it, so they stay valid after trim
+        self._dropped = 0
+        # event_type -> positions
+        self._by_type = {}
+        # host_name -> positions
+        self._by_host = {}
+        # (host_name, service_description) -> positions
+        self._by_service = {}
+        self.extend(records)
+
+    def _indexes(self):
+        for idx in (self._by_type, self._by_host, self._by_service):
+            for key, positions in idx.items():
+                yield idx, key, positions
+
+    def _index_event(self, i, msg):
+        """
+        Add record i to event indexes if it is event of known type
+        """
+        m = event_re.match(msg)
+        if not m:
+            return
+        event_type = m.group(1)
+        if not event_type in EVENT_FIELDS:
+            return
+        p = i + self._dropped
+        keys = [(self._by_type, event_type)]
+        if event_type in _KEY_FIELDS:
+            host_pos, service_pos = _KEY_FIELDS[event_type]
+            values = msg[m.end():].split(';', max(host_pos, service_pos) + 1)
+            if len(values) > host_pos and values[host_pos]:
+                host = values[host_pos]
+                keys.append((self._by_host, host))
+                if service_pos and len(values) > service_pos:
+                    keys.append((self._by_service, (host, values[service_pos])))
+        for idx, key in keys:
+            positions = idx.get(key)
+            if positions is None:
+                idx[key] = array('L', (p,))
+            elif p > positions[-1]:
+                positions.append(p)
+            else:
+                positions.insert(bisect_left(positions, p), p)
+
+    def append(self, ts, msg=None):
+        """
+        Add record, given as timestamp and message or as (timestamp, message)
+        tuple as records list took it
+        """
+        if msg is None:
+            ts, msg = ts
+        try:
+            ts = int(ts)
+        except ValueError:
+            return
+        times = self.times
+        if times and ts < times[-1]:
+            i = bisect_right(times, ts)
+            times.insert(i, ts)
+            self._starts.insert(i, len(self._text))
+            self._lens.insert(i, len(msg))
+            # records after inserted one move
+            p = i + self._dropped
+            for idx, key, positions in self._indexes():
+                j = bisect_left(positions, p)
+                if j < len(positions):
+                    positions[j:] = array('L', [ x + 1 for x in positions[j:] ])
+        else:
+            i = len(times)
+            times.append(ts)
+            self._starts.append(len(self._text))
+            self._lens.append(len(msg))
+        self._text.extend(msg)
+        self._index_event(i, msg)
+        if is_reload(msg):
+            insort(self.reloads, ts)
+
+    def extend(self, records):
+        append = self.append
+        for ts, msg in records:
+            append(ts, msg)
+
+    def __len__(self):
+        return len(self.times)
+
+    def _message(self, i):
+        start = self._starts[i]
+        return str(self._text[start:start + self._lens[i]])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ self[j] for j in xrange(*i.indices(len(self))) ]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('log record index out of range')
+        return (self.times[i], self._message(i))
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield (self.times[i], self._message(i))
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def index(self, ts):
+        """
+        Return index of first record with timestamp not less than ts
+        """
+        return bisect_left(self.times, int(ts))
+
+    def range(self, start=None, end=None):
+        """
+        Yield records with start <= timestamp < end (None means no bound)
+        """
+        if start is None:
+            i = 0
+        else:
+            i = self.index(start)
+        if end is None:
+            j = len(self)
+        else:
+            j = self.index(end)
+        for k in xrange(i, j):
+            yield (self.times[k], self._message(k))
+
+    def events(self, event_type=None, host_name=None,
+            service_description=None, start=None, end=None):
+        """
+        Yield LogEvent's of given type, host and service with start <=
+        timestamp < end in time order (None means any)
+        """
+        if host_name is not None and service_description is not None:
+            positions = self._by_service.get((host_name, service_description))
+        elif host_name is not None:
+            positions = self._by_host.get(host_name)
+        elif event_type is not None:
+            positions = self._by_type.get(event_type)
+        else:
+            positions = sorted([ p for ps in self._by_type.itervalues()
+                for p in ps ])
+        if not positions:
+            return
+        lo, hi = 0, len(positions)
+        if start is not None:
+            lo = bisect_left(positions, self.index(start) + self._dropped)
+        if end is not None:
+            hi = bisect_left(positions, self.index(end) + self._dropped)
+        for k in xrange(lo, hi):
+            i = positions[k] - self._dropped
+            ev = parse_event(self.times[i], self._message(i))
+            if event_type is not None and ev['event_type'] != event_type:
+                continue
+            if service_description is not None \
+                    and ev.get('service_description') != service_description:
+                continue
+            yield ev
+
+    def last_reload(self, since=None):
+        """
+        Return timestamp of last reload or startup of Nagios (not earlier than
+        since), None if there was not any
+        """
+        if not self.reloads:
+            return None
+        last = self.reloads[-1]
+        if since is not None and last < int(since):
+            return None
+        return last
+
+    def trim(self, n):
+        """
+        Keep only n newest records
+        """
+        drop = len(self) - n
+        if drop <= 0:
+            return
+        del self.times[:drop]
+        del self._starts[:drop]
+        del self._lens[:drop]
+        self._dropped += drop
+        for idx, key, positions in self._indexes():
+            del positions[:bisect_left(positions, self._dropped)]
+            if not positions:
+                del idx[key]
+        if self.times:
+            del self.reloads[:bisect_left(self.reloads, self.times[0])]
+            base = min(self._starts)
+            del self._text[:base]
+            self._starts = array('L', [ s - base for s in self._starts ])
+        else:
+            del self.reloads[:]
+            del self._text[:]
+
+class NagLog(model.BaseNagObj):
+    """
+    Nagios log, 'records' is LogStore of (timestamp, message)
+    """
+    obj_type = 'log'
+
+    @classmethod
+    def from_parse(cls, args, fmt):
+        self = cls()
+        dict.__setitem__(self, 'records', LogStore(args))
+        return self
+
+class LogTailer(object):
+    """
+    Incremental reader of log file. Every call of records() yields records
+    appended since previous call, reading only new bytes. If file was
+    truncated it is read again from beginning, if it was rotated (file with
+    the same name has another inode) rest of old file is read and then new
+    file from beginning. Incomplete last line is left until it is finished.
+    """
+    rec_re = LogParser.rec_re
+
+    def __init__(self, filename, pos=None):
+        """
+        filename -- log file
+        pos      -- offset to start reading from (beginning by default)
+        """
+        self.filename = filename
+        # offset after last complete line read
+        self.pos = pos or 0
+        self._fd = None
+        # (st_dev, st_ino) of opened file
+        self._file_id = None
+        # incomplete last line
+        self._partial = ''
+
+    def _open(self):
+        """
+        Open file if it is not opened, returns False if there is no file
+        """
+        if self._fd is not None:
+            return True
+        try:
+            self._fd = os.open(self.filename, os.O_RDONLY)
+        except OSError:
+            return False
+        st = os.fstat(self._fd)
+        self._file_id = (st.st_dev, st.st_ino)
+        if self.pos > st.st_size:
+            self.pos = 0
+        os.lseek(self._fd, self.pos, 0)
+        return True
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = None
+        self._file_id = None
+
+    def _read(self):
+        """
+        Yield records from current position to end of opened file
+        """
+        partial = self._partial
+        rec_match = self.rec_re.match
+        while True:
+            s = os.read(self._fd, READ_CHUNK)
+            if not s:
+                break
+            lines = (partial + s).split('\n')
+            partial = lines.pop()
+            self.pos += len(s) + len(self._partial) - len(partial)
+            self._partial = partial
+            for l in lines:
+                m = rec_match(l.rstrip('\r'))
+                if m:
+                    yield m.groups()
+
+    def records(self):
+        """
+        Yield (timestamp, message) records written since previous call
+        """
+        if not self._open():
+            return
+        st = os.fstat(self._fd)
+        if st.st_size < self.pos + len(self._partial):
+            # truncated
+            self.pos = 0
+            self._partial = ''
+            os.lseek(self._fd, 0, 0)
+        for r in self._read():
+            yield r
+        try:
+            cur = os.stat(self.filename)
+        except OSError:
+            # rotated, new file is not created yet
+            return
+        if (cur.st_dev, cur.st_ino) != self._file_id:
+            # rotated, rest of old file is read above
+            self._close()
+            self.pos = 0
+            self._partial = ''
+            if self._open():
+                for r in self._read():
+                    yield r
+
+    def close(self):
+        self._close()
+
+def register_log_classes(factory=NagiosFactory):
+    factory.register_class(NagLog)
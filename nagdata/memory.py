@@ -0,0 +1,175 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Estimation of memory used by NagData.
+
+Sizes are computed with sys.getsizeof over everything reachable from objects,
+every Python object is counted once, by the first part which reaches it, in
+order: objects (attributes and their values), their formats, tag indexes (only
+dicts and sets, indexed values are counted by objects) and log records. So
+size of part is roughly what would be freed without it.
+"""
+
+import sys
+
+def deep_size(obj, seen):
+    """
+    Return size of obj and everything reachable from it through containers,
+    skipping (and adding to seen) ids in seen
+    """
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        i = id(o)
+        if i in seen or isinstance(o, type):
+            continue
+        seen.add(i)
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.iterkeys())
+            stack.extend(o.itervalues())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        if hasattr(o, '__dict__'):
+            # e.g. groups of group lists
+            stack.append(o.__dict__)
+    return total
+
+def object_size(nagobj, seen):
+    """
+    Return size of object and its attributes (without format and collection)
+    """
+    if id(nagobj) in seen:
+        return 0
+    seen.add(id(nagobj))
+    total = sys.getsizeof(nagobj)
+    d = nagobj.__dict__
+    seen.add(id(d))
+    total += sys.getsizeof(d)
+    for k, v in d.iteritems():
+        if k != 'fmt' and k != 'collection' and k != '_cloned':
+            total += deep_size(k, seen) + deep_size(v, seen)
+    for k, v in dict.iteritems(nagobj):
+        total += deep_size(k, seen) + deep_size(v, seen)
+    return total
+
+def collection_report(coll, seen, sample=None):
+    """
+    Return (objects, formats, indexes) of collection: obj_type -> [count,
+    bytes], obj_type -> bytes, tag -> bytes. If sample is given, only first
+    sample objects of every obj_type are measured and sizes are extrapolated.
+    """
+    objects = {}
+    formats = {}
+    # obj_type -> number of measured objects
+    measured = {}
+    for o in coll:
+        t = o.obj_type
+        c = objects.setdefault(t, [0, 0])
+        c[0] += 1
+        if sample is not None and measured.get(t, 0) >= sample:
+            continue
+        measured[t] = measured.get(t, 0) + 1
+        c[1] += object_size(o, seen)
+        fmt = getattr(o, 'fmt', None)
+        if fmt is not None:
+            formats[t] = formats.get(t, 0) + deep_size(fmt, seen)
+    for t, c in objects.items():
+        if measured[t] < c[0]:
+            c[1] = c[1] * c[0] // measured[t]
+            if t in formats:
+                formats[t] = formats[t] * c[0] // measured[t]
+    indexes = {}
+    for tag, values in coll.tags.items():
+        size = sys.getsizeof(values)
+        for objs in values.itervalues():
+            if not id(objs) in seen:
+                seen.add(id(objs))
+                size += sys.getsizeof(objs)
+        indexes[tag] = size
+    return objects, formats, indexes
+
+def memory_report(nd, top=10, sample=None):
+    """
+    Return estimation of memory used by loaded components of NagData nd:
+
+        {'total': bytes,
+         'objects': {collection: {obj_type: {'count': n, 'bytes': bytes}}},
+         'fmt': {collection: {obj_type: bytes}},
+         'indexes': {collection: {tag: bytes}},
+         'log': {'records': n, 'bytes': bytes},
+         'largest': [(bytes, part, collection, name), ...]}
+
+    largest lists top biggest contributors, part is 'objects', 'fmt',
+    'indexes' or 'log'. If sample is given, only that many objects of every
+    obj_type are measured, which is much faster for large installations.
+    """
+    seen = set()
+    report = {'objects': {}, 'fmt': {}, 'indexes': {}, 'log': None}
+    parts = []
+    for name in ('config', 'status'):
+        if not name in nd.__dict__:
+            continue
+        objects, formats, indexes = collection_report(getattr(nd, name),
+                seen, sample)
+        report['objects'][name] = dict([ (t, {'count': c, 'bytes': b})
+            for t, (c, b) in objects.items() ])
+        report['fmt'][name] = formats
+        report['indexes'][name] = indexes
+        parts.extend([ (b, 'objects', name, t)
+            for t, (c, b) in objects.items() ])
+        parts.extend([ (b, 'fmt', name, t) for t, b in formats.items() ])
+        parts.extend([ (b, 'indexes', name, t) for t, b in indexes.items() ])
+    if 'log' in nd.__dict__:
+        records = nd.log.get('records', [])
+        b = deep_size(records, seen)
+        report['log'] = {'records': len(records), 'bytes': b}
+        parts.append((b, 'log', None, 'records'))
+    parts.sort(reverse=True)
+    report['total'] = sum([ p[0] for p in parts ])
+    report['largest'] = parts[:top]
+    return report
+
+def format_report(report):
+    """
+    Return memory report as text
+    """
+    mb = lambda b: '%10.1f MB' % (b / 1048576.0)
+    lines = ['total %s' % mb(report['total']), '', 'largest:']
+    for b, part, coll, name in report['largest']:
+        lines.append('  %s  %-8s %-7s %s' % (mb(b), part, coll or '', name))
+    for coll, objects in sorted(report['objects'].items()):
+        lines.extend(['', '%s objects:' % coll])
+        for t, c in sorted(objects.items(), key=lambda x: -x[1]['bytes']):
+            lines.append('  %s  %-20s %8d objects' % (mb(c['bytes']), t,
+                c['count']))
+        fmt = report['fmt'].get(coll)
+        if fmt:
+            lines.extend(['', '%s formats:' % coll])
+            for t, b in sorted(fmt.items(), key=lambda x: -x[1]):
+                lines.append('  %s  %s' % (mb(b), t))
+        lines.extend(['', '%s indexes:' % coll])
+        for t, b in sorted(report['indexes'][coll].items(),
+                key=lambda x: -x[1]):
+            lines.append('  %s  %s' % (mb(b), t))
+    if report['log']:
+        lines.extend(['', 'log: %s  %d records' % (mb(report['log']['bytes']),
+            report['log']['records'])])
+    return '\n'.join(lines) + '\n'
@@ -46,6 +46,9 @@ class BaseNagObj(dict):
     _cloned = None
     # object's format
     fmt = None
+    # attribute -> type, values of these attributes are converted with type
+    # when parsed (value is left as is if conversion fails)
+    typed_fields = {}
 
     def __init__(self, **kw):
         """
@@ -79,27 +82,69 @@ class BaseNagObj(dict):
             val = "%s=%s" % (pk, repr(self.get(pk)))
         return val
 
+    @classmethod
+    def decoders(cls):
+        """
+        Return table attribute -> converter of parsed string value. It is
+        built once per class.
+        """
+        if '_decoders' in cls.__dict__:
+            return cls._decoders
+        dec = dict(cls.typed_fields)
+        for a in dir(cls):
+            v = getattr(cls, a, None)
+            if isinstance(v, type) and hasattr(v, 'from_string'):
+                dec[a] = v.from_string
+        # from_parse does not call __init__, so fill tags here
+        cls.tags.update(cls._base_tags)
+        if isinstance(cls.pkey, tuple):
+            cls.tags.update(cls.pkey)
+        else:
+            cls.tags.add(cls.pkey)
+        cls._decoders = dec
+        return dec
+
     @classmethod
     def from_parse(cls, args, fmt):
         """
         Create object from result of parse
         """
-        self = cls()
-        self.fmt = fmt
-        sup = super(BaseNagObj, self)
+        get_dec = cls.decoders().get
+        attrs = {}
         for a, v in args:
-            if hasattr(cls, a):
-                o_v = getattr(cls, a).from_string(v)
-            else:
-                o_v = v
-            if a in self:
+            conv = get_dec(a)
+            if conv is not None:
                 try:
-                    self[a].add(o_v)
-                except:
+                    v = conv(v)
+                except ValueError:
                     pass
+            if a in attrs:
+                add = getattr(attrs[a], 'add', None)
+                if add is not None:
+                    add(v)
             else:
-                sup.__setitem__(a, o_v)
-        self.update_pk()
+                attrs[a] = v
+        self = cls.from_attrs(attrs)
+        self.fmt = fmt
+        return self
+
+    @classmethod
+    def from_attrs(cls, attrs, __id=None):
+        """
+        Create object from dict of already converted attribute values without
+        checking them, __id is computed if not given
+        """
+        cls.decoders()
+        self = cls.__new__(cls)
+        dict.update(self, attrs)
+        if __id is not None:
+            self.__id = __id
+        elif cls.pkey:
+            self.__id = cls.pk_hash(attrs)
+        else:
+            self.__id = object.__hash__(self)
+        dict.__setitem__(self, 'obj_type', cls.obj_type)
+        dict.__setitem__(self, '__id', self.__id)
         return self
 
     def fields(self):
@@ -115,13 +160,22 @@ class BaseNagObj(dict):
         Update pkey and __id. It should be called when attributes in self.pkey
         change
         """
-        pk = self.pkey
-        if pk:
-            self.__id = hash((self.obj_type, pk,
-                isinstance(pk, str) and (pk in self and self[pk] or None)
-                or tuple([ k in self and self[k] or None for k in pk ])))
+        if self.pkey:
+            self.__id = self.pk_hash(self)
         super(BaseNagObj, self).__setitem__('__id', self.__id)
 
+    @classmethod
+    def pk_hash(cls, attrs):
+        """
+        Return __id of object of this class with attributes attrs
+        """
+        pk = cls.pkey
+        if isinstance(pk, str):
+            key = attrs.get(pk) or None
+        else:
+            key = tuple([ attrs.get(k) or None for k in pk ])
+        return hash((cls.obj_type, pk, key))
+
     def is_pk(self, attr):
         """
         Check if attr is primary key or its part
@@ -181,11 +235,17 @@ class BaseNagObj(dict):
         if __id is None:
             self.update_pk()
         else:
-            self.__id = __id
-            super(BaseNagObj, self).__setitem__('__id', __id)
+            self.set_id(__id)
         self.fmt = None
         return self
 
+    def set_id(self, __id):
+        """
+        Set __id of object (it is used as hash)
+        """
+        self.__id = __id
+        super(BaseNagObj, self).__setitem__('__id', __id)
+
     def to_structure(self):
         """
         Return object's representation as base structure
@@ -302,6 +362,11 @@ class BaseNagObj(dict):
             attr_class = getattr(self.__class__, attr)
             if not isinstance(value, attr_class):
                 value = attr_class(value)
+        if self.collection is not None and not self._cloned and \
+                self.collection.deferred(self, attr):
+            # collection updates its indexes later
+            sup.__setitem__(attr, value)
+            return
         sup.__setitem__(attr, value)
         if self.is_pk(attr):
             pk = self['__id']
@@ -321,7 +386,7 @@ class BaseNagObj(dict):
                     sup.__setitem__('__id', pk)
                     raise NotUnique(
                     "Object '%s' with %s already exists in collection" % \
-                            (self.obj_type, self.pkey_value()))
+                            (self.obj_type, self.pkey_repr()))
             else:
                 self.collection.update_tag(attr, cv, value, self)
 
@@ -419,11 +484,49 @@ class NagCommand(NagObj):
 
 
 # Nagios status objects
+
+# numeric attributes of status objects
+STATUS_INT_FIELDS = ['acknowledgement_type', 'active_checks_enabled',
+    'active_host_checks_enabled', 'active_ondemand_host_check_stats',
+    'active_service_checks_enabled', 'check_host_freshness', 'check_options',
+    'check_service_freshness', 'check_type', 'comment_id', 'created',
+    'current_attempt', 'current_event_id', 'current_notification_id',
+    'current_notification_number', 'current_problem_id', 'current_state',
+    'daemon_mode', 'enable_event_handlers', 'enable_failure_prediction',
+    'enable_flap_detection', 'enable_notifications', 'entry_time',
+    'entry_type', 'event_handler_enabled', 'expire_time', 'expires',
+    'failure_prediction_enabled', 'flap_detection_enabled',
+    'has_been_checked', 'host_notifications_enabled', 'is_flapping',
+    'last_check',
+    'last_command_check', 'last_event_id', 'last_hard_state',
+    'last_hard_state_change', 'last_host_notification',
+    'last_log_rotation', 'last_notification', 'last_problem_id',
+    'last_service_notification', 'last_state_change', 'last_time_critical',
+    'last_time_down', 'last_time_ok', 'last_time_unknown',
+    'last_time_unreachable', 'last_time_up', 'last_time_warning',
+    'last_update', 'max_attempts', 'modified_attributes',
+    'modified_host_attributes', 'modified_service_attributes', 'nagios_pid',
+    'next_check', 'next_comment_id', 'next_downtime_id', 'next_event_id',
+    'next_notification', 'next_notification_id', 'next_problem_id',
+    'no_more_notifications', 'notifications_enabled', 'obsess_over_host',
+    'obsess_over_hosts', 'obsess_over_service', 'obsess_over_services',
+    'passive_checks_enabled', 'passive_host_checks_enabled',
+    'passive_service_checks_enabled', 'pending_flex_downtime', 'persistent',
+    'problem_has_been_acknowledged', 'process_performance_data',
+    'program_start', 'scheduled_downtime_depth',
+    'service_notifications_enabled', 'should_be_scheduled', 'source',
+    'state_type']
+STATUS_FLOAT_FIELDS = ['check_execution_time', 'check_interval',
+    'check_latency', 'normal_check_interval', 'percent_state_change',
+    'retry_check_interval', 'retry_interval']
+
 class NagStat(BaseNagObj):
     """
     Nagios status
     """
     obj_group = 'status'
+    typed_fields = dict([ (a, int) for a in STATUS_INT_FIELDS ] +
+            [ (a, float) for a in STATUS_FLOAT_FIELDS ])
     def __str__(self):
         return "%s {\n\t%s\n\t}\n" % (self.obj_type, "\n\t".join([
             "%s = %s" % (a, v) for a, v in self.fields() ]))
@@ -466,6 +569,7 @@ class NagConfig(NagStat):
     """
     obj_group = 'config'
     obj_type = 'ROOT'
+    typed_fields = {}
     cfg_file = fields.group_list(fields.value_list)
     cfg_dir = fields.group_list(fields.value_list)
 
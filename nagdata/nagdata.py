@@ -20,44 +20,105 @@
 Python interface to Nagios objects and status
 """
 
-import glob
 import os
 import time
-import re
+import threading
+import contextlib
 
-from nagfile import NagObjectFile, NagStatusFile, NagConfigFile, NagLogFile
+from nagfile import NagObjectFile, NagStatusFile, NagConfigFile
 from collection import NagCollection
 from factory import NagiosFactory
+from scanner import CfgDirScanner, file_ctime
 from exceptions import NotFound, TooMany, NotInConfig, ConfigNotGiven
+from stats import stats
+from trace import traced
+import trace
 import model
 import fmt
 import log
+import archive
+import memory
+
+class LazyAttribute(object):
+    """
+    Attribute of NagData which is loaded on first access by calling loader
+    method. Loader sets attribute in instance's __dict__, so later access does
+    not go through this descriptor.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        getattr(obj, self.loader)()
+        return obj.__dict__[self.name]
 
 class NagData(object):
     """
     Provides interface to Nagios objects and status.
     """
-    starting_re = re.compile('^Nagios .+ starting\.\.\.')
+    # message of Nagios startup (see log.is_reload), before log below hides
+    # log module
+    starting_re = log.starting_re
+    # components which are not preloaded are loaded on first access
+    cfg = LazyAttribute('cfg', '_init_cfg')
+    config = LazyAttribute('config', '_init_config')
+    status = LazyAttribute('status', '_init_status')
+    status_ctime = LazyAttribute('status_ctime', '_init_status')
+    log = LazyAttribute('log', '_init_log')
+    log_pos = LazyAttribute('log_pos', '_init_log')
+    # number of newest log records kept in log, None keeps all
+    max_log_records = None
 
     def __init__(self, config_file='/etc/nagios/nagios.cfg',
             factory=NagiosFactory,
-            keep_backup=True):
-        """
-        config_file -- Nagios configuration file
-        keep_backup -- keep backup copy of configuration file we're writing at
-                       save_object
+            keep_backup=True,
+            scan_threads=4,
+            preload=('config', 'status', 'log')):
+        """
+        config_file  -- Nagios configuration file
+        keep_backup  -- keep backup copy of configuration file we're writing at
+                        save_object
+        scan_threads -- number of threads to scan cfg_dir's and stat
+                        configuration files in
+        preload      -- components to load at once: 'cfg' (nagios.cfg only),
+                        'config', 'status', 'log'; others are loaded on first
+                        access to corresponding attribute
         """
         self.factory = factory
         model.register_all_classes(self.factory)
         fmt.register_fmt_classes(self.factory)
         log.register_log_classes(self.factory)
         self.nagios_cfg = config_file
-        self.cfg, self.config = self.load_config()
-        self.status, self.status_ctime = self.load_status()
-        self.log, self.log_pos = self.load_log()
+        # filename -> ctime of configuration file when it was loaded
+        self._cfg_ctimes = {}
+        # scanner of cfg_dir's, caches their listings
+        self._cfg_scanner = CfgDirScanner(scan_threads)
+        # (ctime, parsed nagios.cfg) used to check for outdated configuration
+        self._cfg_parsed = None
         # time of last check for nagios reload
-        self.last_reload = time.strftime("%s")
+        self.last_reload = int(time.time())
         self.keep_backup = keep_backup
+        for c in preload:
+            getattr(self, '_init_' + c)()
+
+    def _init_cfg(self):
+        self.cfg = self.load_main_config()
+
+    def _init_config(self):
+        self.cfg, self.config = self.load_config()
+
+    def _init_status(self):
+        self.status, self.status_ctime = self.load_status()
+
+    def _init_log(self):
+        self._log_tailer = log.LogTailer(self.cfg['log_file'])
+        self.log = self.factory.from_parse('log', [], None)
+        self.log_pos = 0
+        self.update_log()
 
     def load_config_file(self, filename):
         """
@@ -65,7 +126,36 @@ class NagData(object):
         in it, may be useful for incremental update of configuration
         Does not suit for loading main nagios.cfg
         """
-        return NagObjectFile(filename, self.factory).parse(add_file_info=True)
+        ctime, objs = self.read_config_file(filename)
+        self._config_file_read(filename, ctime)
+        return objs
+
+    @traced('load_config_file', lambda self, filename: {'file': filename})
+    def read_config_file(self, filename):
+        """
+        Parse configuration file, returns its ctime (None if file was removed)
+        and collection of objects. Unlike load_config_file it does not record
+        ctime of file, so it may be called from other thread
+        """
+        ctime = file_ctime(filename)
+        if ctime is None:
+            # file was removed, so there are no objects in it
+            return None, NagCollection(notags=True)
+        return ctime, NagObjectFile(filename, self.factory).parse(
+                add_file_info=True)
+
+    def _config_file_read(self, filename, ctime, cfg=None):
+        """
+        Record ctime of configuration file read (None if it was removed),
+        config_outdated compares files with it. cfg is representation of
+        nagios.cfg
+        """
+        if ctime is None:
+            self._cfg_ctimes.pop(filename, None)
+        else:
+            self._cfg_ctimes[filename] = ctime
+        if cfg is not None:
+            self._cfg_parsed = (ctime, cfg)
 
     def load_config(self):
         """
@@ -73,106 +163,297 @@ class NagData(object):
         configuration file (nagios.cfg) and config collection
         """
         nco = NagCollection(obj_group='config')
-        cfg = NagConfigFile(self.nagios_cfg, self.factory).parse(add_file_info=True)
-        nco.add(cfg)
-        for f in cfg['cfg_file']:
-            nco.extend(self.load_config_file(f))
-        for d in cfg['cfg_dir']:
-            for f in glob.glob("%s/*.cfg" % d):
-                nco.extend(self.load_config_file(f))
+        with stats.timer('nagdata_phase', phase='read_config'):
+            cfg, colls, ctimes = self.read_config()
+        self._config_read(cfg, ctimes)
+        with stats.timer('nagdata_phase', phase='index'):
+            nco.add(cfg)
+            for c in colls:
+                nco.extend(c)
         return cfg, nco
 
+    def read_config(self):
+        """
+        Parse main configuration file and object files, returns representation
+        of nagios.cfg, list of not indexed collections of objects, one for
+        every object file, and dict filename -> ctime of files read. ctimes
+        are not recorded (see _config_read), so it may be called from other
+        thread
+        """
+        ctime, cfg = self.read_main_config()
+        ctimes = {self.nagios_cfg: ctime}
+        files = list(cfg['cfg_file']) + \
+                sorted(self._cfg_scanner.scan(cfg['cfg_dir']))
+        colls = []
+        for f in files:
+            ctime, objs = self.read_config_file(f)
+            if ctime is not None:
+                ctimes[f] = ctime
+            colls.append(objs)
+        return cfg, colls, ctimes
+
+    def _config_read(self, cfg, ctimes):
+        """
+        Record ctimes of configuration files read by read_config, they replace
+        ctimes of previously loaded files
+        """
+        self._cfg_ctimes = ctimes
+        self._cfg_parsed = (ctimes[self.nagios_cfg], cfg)
+
+    def load_main_config(self):
+        """
+        Load main configuration file (nagios.cfg) and return its representation
+        """
+        ctime, cfg = self.read_main_config()
+        self._config_file_read(self.nagios_cfg, ctime, cfg)
+        return cfg
+
+    def read_main_config(self):
+        """
+        Parse main configuration file, returns its ctime and representation
+        without recording ctime (see read_config_file)
+        """
+        ctime = file_ctime(self.nagios_cfg)
+        cfg = NagConfigFile(self.nagios_cfg, self.factory).parse(add_file_info=True)
+        return ctime, cfg
+
+
+    @traced('load_status')
     def load_status(self):
         """
         Load status file and objects, returns status collection and it's change
         time (ctime of file)
         """
         nso = NagCollection()
+        with stats.timer('nagdata_phase', phase='read_status'):
+            objs, status_ctime = self.read_status()
+        with stats.timer('nagdata_phase', phase='index'):
+            nso.extend(objs)
+        return nso, status_ctime
+
+    def read_status(self):
+        """
+        Parse status file, returns not indexed collection of status objects and
+        ctime of file
+        """
         try:
-            nso.extend(NagStatusFile(self.cfg['status_file'], self.factory).parse())
+            objs = NagStatusFile(self.cfg['status_file'], self.factory).parse()
         except:
-            pass
+            objs = NagCollection(notags=True)
         try:
             status_ctime = os.stat(self.cfg['status_file']).st_ctime
         except:
             status_ctime = 0
-        return nso, status_ctime
+        return objs, status_ctime
 
     def load_log(self, filename=None, pos=None):
         """
         Load nagios.log file, or its archive copy, returns log file and position
+        after last record read, reads starting from pos if it is given
         """
         if not filename:
             filename = self.cfg['log_file']
-        log = NagLogFile(filename, self.factory).parse(add_file_info=True)
-        pos = log['__byte_pos']
-        return log, pos
+        tailer = log.LogTailer(filename, pos)
+        try:
+            nlog = self.factory.from_parse('log', tailer.records(), None)
+        finally:
+            tailer.close()
+        dict.__setitem__(nlog, '__filename', filename)
+        dict.__setitem__(nlog, '__byte_pos', tailer.pos)
+        return nlog, tailer.pos
+
+    def log_archive(self, cache_dir=None, processes=None):
+        """
+        Return LogArchive of log_archive_path (archives directory next to
+        log_file if it is not set) and current log file, see
+        archive.LogArchive
+        """
+        path = self.cfg.get('log_archive_path')
+        if not path:
+            path = os.path.join(os.path.dirname(self.cfg['log_file']),
+                    'archives')
+        return archive.LogArchive(path, self.cfg['log_file'], cache_dir,
+                processes)
 
+    @traced('update_config')
     def update_config(self):
         """
         Update current configuration, changed and created objects remain in
         config collection
         """
-        main_cfg, cfg_objs = self.load_config()
+        r = self.load_config()
+        with stats.timer('nagdata_phase', phase='replace'):
+            self.replace_config(*r)
+        if stats.enabled:
+            self.record_stats()
+
+    def replace_config(self, main_cfg, cfg_objs):
+        """
+        Replace configuration with loaded one (see load_config), changed and
+        created objects remain in config collection
+        """
         # add changed and created config objects to new collection
         cfg_objs.update(self.config)
         self.config = cfg_objs
         self.cfg = main_cfg
 
+    @traced('update_config_file',
+            lambda self, filename: {'file': filename})
     def update_config_file(self, filename):
         """
         Update config with objects from given file, can also update self.cfg
-        from main nagios.cfg
+        from main nagios.cfg. Objects which were removed from file (or all its
+        objects if file was removed) are removed from config
         """
         if filename != self.nagios_cfg:
             objs = self.load_config_file(filename)
-            self.config.update(objs)
+            with stats.timer('nagdata_phase', phase='replace'):
+                self.replace_config_file(filename, objs)
         else:
-            cfg = NagConfigFile(self.nagios_cfg, self.factory).parse(add_file_info=True)
-            self.config.remove(self.cfg)
-            self.cfg = cfg
-            self.config.add(cfg)
+            cfg = self.load_main_config()
+            with stats.timer('nagdata_phase', phase='replace'):
+                self.replace_main_config(cfg)
+        if stats.enabled:
+            self.record_stats()
 
+    def replace_main_config(self, cfg):
+        """
+        Replace representation of nagios.cfg with loaded one (see
+        load_main_config)
+        """
+        self.config.remove(self.cfg)
+        self.cfg = cfg
+        self.config.add(cfg)
+
+    def replace_config_file(self, filename, cfg_objs):
+        """
+        Replace objects of file in config with loaded ones (see
+        load_config_file)
+        """
+        self.config.update_file(filename, cfg_objs)
+
+    @traced('update_outdated_config')
+    def update_outdated_config(self):
+        """
+        Update config only from files which were added, changed or removed
+        since last load (see config_outdated), returns ConfigChanges. Objects
+        of removed files are dropped without reading them, file may still
+        exist but be no longer in configuration
+        """
+        changes, loaded = self.load_outdated_config()
+        with stats.timer('nagdata_phase', phase='replace'):
+            self.replace_outdated_config(loaded)
+        if stats.enabled:
+            self.record_stats()
+        return changes
+
+    def load_outdated_config(self):
+        """
+        Load files which were added, changed or removed since last load (see
+        config_outdated) without changing config, returns (ConfigChanges,
+        list of (filename, ctime, loaded objects)), nagios.cfg goes first.
+        Removed files get empty collections. Only files are read, ctimes are
+        recorded by replace_outdated_config, so it may be called from other
+        thread
+        """
+        changes = self.config_outdated()
+        loaded = []
+        if self.nagios_cfg in changes:
+            loaded.append((self.nagios_cfg,) + self.read_main_config())
+        for f in changes:
+            if f == self.nagios_cfg:
+                continue
+            if f in changes.removed:
+                loaded.append((f, None, NagCollection(obj_group='config')))
+            else:
+                loaded.append((f,) + self.read_config_file(f))
+        return changes, loaded
+
+    def replace_outdated_config(self, loaded):
+        """
+        Replace files in config with loaded ones and record their ctimes (see
+        load_outdated_config)
+        """
+        for f, ctime, objs in loaded:
+            if f == self.nagios_cfg:
+                self.replace_main_config(objs)
+                self._config_file_read(f, ctime, objs)
+            else:
+                self.replace_config_file(f, objs)
+                self._config_file_read(f, ctime)
+
+    @traced('update_status')
     def update_status(self):
         """
         Update current status, status collection is fully updated, changes (if
         were, but shouldn't be) are discarded
         """
-        stat, ctime = self.load_status()
+        r = self.load_status()
+        with stats.timer('nagdata_phase', phase='replace'):
+            self.replace_status(*r)
+        if stats.enabled:
+            self.record_stats()
+
+    def replace_status(self, stat, ctime):
+        """
+        Replace status collection with loaded one (see load_status)
+        """
         self.status_ctime = ctime
         self.status = stat
 
     def update_log(self):
-        nlog, npos = self.load_log(filename=self.cfg['log_file'],
-                pos=self.log_pos)
-        self.log['records'].extend(nlog['records'])
-        self.log_pos = npos
+        """
+        Append records written to nagios.log since last read, only new bytes
+        are read; if log was truncated or rotated it is read from beginning.
+        Keeps at most max_log_records newest records
+        """
+        # loads log (and creates tailer) if it is not loaded yet
+        records = self.log['records']
+        if self._log_tailer.filename != self.cfg['log_file']:
+            self._log_tailer.close()
+            self._log_tailer = log.LogTailer(self.cfg['log_file'])
+        records.extend(self._log_tailer.records())
+        if self.max_log_records is not None:
+            records.trim(self.max_log_records)
+        self.log_pos = self._log_tailer.pos
 
     def config_outdated(self):
         """
-        Check if configuration files were updated since last load, returns set
-        of updated files
-        """
-        outdated = set()
-        for fn, fs in self.config.tags['__filename'].items():
-            try:
-                ctime = os.stat(fn).st_ctime
-                if fs:
-                    if ctime > list(fs)[0]['__ctime']:
-                        outdated.add(fn)
-                else:
-                    outdated.add(fn)
-            except:
-                if fs:
-                    outdated.add(fn)
-        cfg = NagConfigFile(self.nagios_cfg,
-                self.factory).parse()
-        for f in cfg['cfg_file'] + reduce(lambda s, x: s + x,
-                 [ glob.glob("%s/*.cfg" % d) for d in cfg['cfg_dir'] ], []):
-                # appeared new file
-                if not f in self.config.tags['__filename']:
-                    outdated.add(f)
-        return outdated
+        Check if configuration files were updated since last load, returns
+        ConfigChanges with added, changed and removed files. nagios.cfg is
+        parsed again only if it changed and directories are read again only if
+        their mtime changed
+        """
+        # make sure config is loaded to compare with
+        self.config
+        # ctimes may be recorded by other thread meanwhile, so they are read
+        # once; self._cfg_parsed and listings of scanner are only caches which
+        # are replaced whole
+        known = dict(self._cfg_ctimes)
+        added, changed, removed = set(), set(), set()
+        ctimes = self._cfg_scanner.ctimes(known)
+        for fn, ctime in known.items():
+            cur = ctimes[fn]
+            if cur is None:
+                removed.add(fn)
+            elif ctime is None or cur > ctime:
+                changed.add(fn)
+        ctime, cfg = self._cfg_parsed
+        cur = ctimes.get(self.nagios_cfg)
+        if not cur is None and cur != ctime:
+            cfg = NagConfigFile(self.nagios_cfg, self.factory).parse()
+            self._cfg_parsed = (cur, cfg)
+        files = set(cfg['cfg_file'])
+        files.update(self._cfg_scanner.scan(cfg['cfg_dir']))
+        files.add(self.nagios_cfg)
+        for f in files:
+            # appeared new file
+            if not f in known:
+                added.add(f)
+        # file is not in configuration anymore
+        removed.update(set(known) - files)
+        changed.difference_update(removed)
+        return ConfigChanges(added, changed, removed)
 
     def status_outdated(self):
         """
@@ -186,27 +467,27 @@ class NagData(object):
 
     def nagios_reloaded(self, since=None):
         """
-        Check if Nagios process was reloaded since last check
+        Check if Nagios process was reloaded since last check (or since given
+        timestamp), returns timestamp of last reload or None
         """
         if not since:
             since = self.last_reload
         self.update_log()
-        n = 0
-        for ts, msg in self.log['records']:
-            if ts >= since:
-                break
-            n += 1
-        new_recs = self.log['records'][n:]
-        reload_ts = None
-        for ts, msg in new_recs:
-            #print msg
-            if msg == 'Caught SIGHUP, restarting...' \
-                    or self.starting_re.match(msg):
-                reload_ts = ts
+        reload_ts = self.log['records'].last_reload(since)
         if reload_ts:
             self.last_reload = reload_ts
         return reload_ts
 
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context in which changes of objects do not update indexes of config
+        and status collections until exit (see NagCollection.batch)
+        """
+        with self.config.batch():
+            with self.status.batch():
+                yield self
+
     def new(self, obj_type, **kw):
         """
         Create nagios object of obj_type, set its fields from kw, add it to
@@ -235,13 +516,14 @@ class NagData(object):
         Get set of all objects with givent type matching given key-value
         """
         # here we use fact that config and status objects are in different
-        # collections
-        if obj_type in self.config.tags['obj_type']:
-            return self.config.filter(obj_type=obj_type, **tags)
-        elif obj_type in self.status.tags['obj_type']:
+        # collections, so only collection for obj_type's group is loaded
+        C = self.factory.obj_types.get(obj_type)
+        if C is None:
+            return set()
+        elif C.obj_group == 'status':
             return self.status.filter(obj_type=obj_type, **tags)
         else:
-            return set()
+            return self.config.filter(obj_type=obj_type, **tags)
 
     def get(self, obj_type, **kw):
         """
@@ -272,6 +554,8 @@ class NagData(object):
         else:
             return o.pop()
 
+    @traced('save', lambda self, nagobj, filename=None: {'obj_type':
+        nagobj.obj_type, 'file': filename or nagobj.get('__filename')})
     def save(self, nagobj, filename=None):
         """
         Save object to file and set __filename attribute
@@ -290,7 +574,7 @@ class NagData(object):
         if not nagobj in self.config:
             self.config.add(nagobj)
 
-        objs = list(self.filter(__filename=filename))
+        objs = list(self.config.filter(__filename=filename))
         objs.sort(cmp=lambda a, b: cmp(a.get('__pos', 10000),
             b.get('__pos', 10000)))
         s = ''.join([ str(o) for o in objs ])
@@ -312,6 +596,49 @@ class NagData(object):
         ctime = os.stat(filename).st_ctime
         for o in objs:
             o['__ctime'] = ctime
+        self._cfg_ctimes[filename] = ctime
+
+    def record_stats(self):
+        """
+        Set gauges of stats (see stats module) with numbers of objects and
+        sizes of indexes of loaded collections
+        """
+        for name in ('config', 'status'):
+            if not name in self.__dict__:
+                continue
+            coll = getattr(self, name)
+            for obj_type, objs in coll.tags.get('obj_type', {}).items():
+                stats.gauge('nagdata_objects', len(objs), collection=name,
+                        obj_type=obj_type)
+            for tag, (values, entries) in coll.index_sizes().items():
+                stats.gauge('nagdata_index_values', values, collection=name,
+                        tag=tag)
+                stats.gauge('nagdata_index_entries', entries,
+                        collection=name, tag=tag)
+
+    def memory_report(self, top=10, sample=None):
+        """
+        Return estimation of memory used by objects, their formats, indexes
+        and log records with top largest contributors, sample limits number
+        of measured objects of every obj_type (see memory.memory_report,
+        memory.format_report formats it as text)
+        """
+        return memory.memory_report(self, top, sample)
+
+
+class ConfigChanges(set):
+    """
+    Set of outdated configuration files as returned by
+    NagData.config_outdated, also tells which files were added, changed or
+    removed
+    """
+
+    def __init__(self, added=(), changed=(), removed=()):
+        self.added = set(added)
+        self.changed = set(changed)
+        self.removed = set(removed)
+        super(ConfigChanges, self).__init__(
+                self.added | self.changed | self.removed)
 
 
 
@@ -373,7 +700,7 @@ class SimpleApi(object):
         list of servicestatus for host
         """
         h = self.get_host(host)
-        return list(self.getall('servicestatus', host_name=h.fields.host_name))
+        return list(self.getall('servicestatus', host_name=h['host_name']))
 
     def get_hostgroup_statuses(self, hostgroup_name):
         """
@@ -465,46 +792,47 @@ class OnUpdateCallbacks(object):
     Mixin to add callbacks on update to NagData
     """
 
-    def update_config(self):
+    def replace_config(self, main_cfg, cfg_objs):
         """
-        Update current configuration, changed and created objects remain in
-        config collection, call on_update_config(old, new) before any update
+        Replace configuration with loaded one, changed and created objects
+        remain in config collection, call before_update_config(old, new)
+        before and after_update_config() after update
         """
-        main_cfg, cfg_objs = self.load_config()
-        self.before_update_config(self.config, cfg_objs)
-        # add changed and created config objects to new collection
-        cfg_objs.update(self.config)
-        self.config = cfg_objs
-        self.cfg = main_cfg
-        self.after_update_config()
+        with stats.timer('nagdata_phase', phase='callbacks'), \
+                trace.span('before_update_config'):
+            self.before_update_config(self.config, cfg_objs)
+        super(OnUpdateCallbacks, self).replace_config(main_cfg, cfg_objs)
+        with stats.timer('nagdata_phase', phase='callbacks'), \
+                trace.span('after_update_config'):
+            self.after_update_config()
 
-    def update_config_file(self, filename):
+    def replace_config_file(self, filename, cfg_objs):
         """
-        Update config with objects from given file, can also update self.cfg
-        from main nagios.cfg
+        Replace objects of file in config with loaded ones, call
+        before_update_config(old, new) before and after_update_config() after
+        update
         """
-        if filename != self.nagios_cfg:
-            cfg_objs = self.load_config_file(filename)
+        with stats.timer('nagdata_phase', phase='callbacks'), \
+                trace.span('before_update_config'):
             self.before_update_config(self.config, cfg_objs)
-            self.config.update(cfg_objs)
+        super(OnUpdateCallbacks, self).replace_config_file(filename, cfg_objs)
+        with stats.timer('nagdata_phase', phase='callbacks'), \
+                trace.span('after_update_config'):
             self.after_update_config()
-        else:
-            cfg = NagConfigFile(self.nagios_cfg, self.factory).parse(add_file_info=True)
-            self.config.remove(self.cfg)
-            self.cfg = cfg
-            self.config.add(cfg)
 
-    def update_status(self):
-        """
-        Update current status, status collection is fully updated, changes (if
-        were, but shouldn't be) are discarded, call on_update_status(old, new)
-        before any update
-        """
-        stat, ctime = self.load_status()
-        self.before_update_status(self.config, stat)
-        self.status_ctime = ctime
-        self.status = stat
-        self.after_update_status()
+    def replace_status(self, stat, ctime):
+        """
+        Replace status collection with loaded one, changes (if were, but
+        shouldn't be) are discarded, call before_update_status(old, new) before
+        and after_update_status() after update
+        """
+        with stats.timer('nagdata_phase', phase='callbacks'), \
+                trace.span('before_update_status'):
+            self.before_update_status(self.status, stat)
+        super(OnUpdateCallbacks, self).replace_status(stat, ctime)
+        with stats.timer('nagdata_phase', phase='callbacks'), \
+                trace.span('after_update_status'):
+            self.after_update_status()
 
     def before_update_config(self, old_config, new_config):
         """
@@ -536,3 +864,205 @@ class NagDataSimpleApi(SimpleApi, OnUpdateCallbacks, NagData):
     """
     pass
 
+class SnapshotIsolation(object):
+    """
+    Mixin to make NagData safe to use from many threads. Updates are serialized
+    with self.lock and are made on copies of config and status collections
+    which are published when update completes. Queries (filter, getall and
+    everything using them) use published collections, so they never block and
+    never see half-updated collections, except queries made by updating
+    thread inside writing() context which use collections being updated.
+    Should precede OnUpdateCallbacks and NagData in bases.
+
+    Objects should be changed only inside writing() context, direct access to
+    self.config and self.status during update gives collections being updated.
+    """
+
+    def __init__(self, *args, **kw):
+        self.lock = threading.RLock()
+        # names of collections copied by current update
+        self._writable = None
+        # thread making current update
+        self._writer = None
+        self._refresh_stop = None
+        self.refresh_error = None
+        super(SnapshotIsolation, self).__init__(*args, **kw)
+
+    def published(self, name):
+        """
+        Return last published collection ('config' or 'status')
+        """
+        try:
+            return self.__dict__['_published_' + name]
+        except KeyError:
+            with self.lock:
+                if not '_published_' + name in self.__dict__:
+                    self.__dict__['_published_' + name] = getattr(self, name)
+                return self.__dict__['_published_' + name]
+
+    def _reading(self, name):
+        """
+        Return collection queries should use: being updated one in thread
+        making update, published one otherwise
+        """
+        if self._writer is threading.current_thread():
+            return getattr(self, name)
+        return self.published(name)
+
+    @contextlib.contextmanager
+    def writing(self, *names):
+        """
+        Context of update: holds self.lock, changes are made on copies of
+        named collections ('config', 'status') which are published on exit.
+        Nested contexts are published with outermost one.
+        """
+        with self.lock:
+            outer = self._writable is None
+            if outer:
+                self._writable = set()
+                self._writer = threading.current_thread()
+            for n in names:
+                if not n in self._writable:
+                    setattr(self, n, self.published(n).copy())
+                    self._writable.add(n)
+            try:
+                yield self
+            except:
+                if outer:
+                    # discard changed copies
+                    for n in self._writable:
+                        c = self.published(n)
+                        for o in c:
+                            o.collection = c
+                        c.unshare()
+                        setattr(self, n, c)
+                    self._writable = None
+                    self._writer = None
+                raise
+            if outer:
+                for n in ('config', 'status'):
+                    if n in self.__dict__:
+                        self.__dict__['_published_' + n] = self.__dict__[n]
+                # previous collections are not changed anymore, so sets
+                # shared with them need not be copied on change
+                for n in self._writable:
+                    self.__dict__[n].unshare()
+                self._writable = None
+                self._writer = None
+
+    def filter(self, **tags):
+        return self._reading('config').filter(**tags).union(
+                self._reading('status').filter(**tags))
+
+    def getall(self, obj_type, **tags):
+        C = self.factory.obj_types.get(obj_type)
+        if C is None:
+            return set()
+        elif C.obj_group == 'status':
+            return self._reading('status').filter(obj_type=obj_type, **tags)
+        else:
+            return self._reading('config').filter(obj_type=obj_type, **tags)
+
+    def update_config(self):
+        with self.writing():
+            super(SnapshotIsolation, self).update_config()
+
+    def update_config_file(self, filename):
+        with self.writing('config'):
+            super(SnapshotIsolation, self).update_config_file(filename)
+
+    def replace_config(self, main_cfg, cfg_objs):
+        with self.writing():
+            super(SnapshotIsolation, self).replace_config(main_cfg, cfg_objs)
+
+    def replace_config_file(self, filename, cfg_objs):
+        with self.writing('config'):
+            super(SnapshotIsolation, self).replace_config_file(filename,
+                    cfg_objs)
+
+    def replace_main_config(self, cfg):
+        with self.writing('config'):
+            super(SnapshotIsolation, self).replace_main_config(cfg)
+
+    def replace_status(self, stat, ctime):
+        with self.writing():
+            super(SnapshotIsolation, self).replace_status(stat, ctime)
+
+    def update_outdated_config(self):
+        with self.writing('config'):
+            return super(SnapshotIsolation, self).update_outdated_config()
+
+    def config_outdated(self):
+        with self.lock:
+            return super(SnapshotIsolation, self).config_outdated()
+
+    def update_status(self):
+        with self.writing():
+            super(SnapshotIsolation, self).update_status()
+
+    def update_log(self):
+        with self.lock:
+            super(SnapshotIsolation, self).update_log()
+
+    def nagios_reloaded(self, since=None):
+        with self.lock:
+            return super(SnapshotIsolation, self).nagios_reloaded(since)
+
+    def new(self, obj_type, **kw):
+        with self.writing('config'):
+            return super(SnapshotIsolation, self).new(obj_type, **kw)
+
+    def remove(self, nagobj):
+        with self.writing('config', 'status'):
+            super(SnapshotIsolation, self).remove(nagobj)
+
+    def save(self, nagobj, filename=None):
+        with self.writing('config'):
+            super(SnapshotIsolation, self).save(nagobj, filename)
+
+    def refresh(self):
+        """
+        Update status and configuration if they are outdated
+        """
+        with self.lock:
+            if self.status_outdated():
+                self.update_status()
+            if self.config_outdated():
+                self.update_outdated_config()
+
+    def _refresh_loop(self, interval, stop):
+        while not stop.is_set():
+            try:
+                self.refresh()
+                self.refresh_error = None
+            except Exception, e:
+                self.refresh_error = e
+            stop.wait(interval)
+
+    def start_refresh(self, interval=5):
+        """
+        Start background thread calling refresh every interval seconds, last
+        error of refresh is kept in self.refresh_error
+        """
+        self.stop_refresh()
+        self._refresh_stop = threading.Event()
+        t = threading.Thread(target=self._refresh_loop,
+                args=(interval, self._refresh_stop))
+        t.daemon = True
+        t.start()
+
+    def stop_refresh(self):
+        """
+        Stop background refresh thread
+        """
+        if self._refresh_stop is not None:
+            self._refresh_stop.set()
+            self._refresh_stop = None
+
+class NagDataThreadSafe(SnapshotIsolation, NagDataSimpleApi):
+    """
+    NagData with simple api, callbacks on update and snapshot isolation of
+    queries from updates
+    """
+    pass
+
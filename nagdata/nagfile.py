@@ -24,9 +24,11 @@ Nagios file with objects.
 from parser import ObjectParser, StatusParser, ConfigParser, LogParser
 from factory import NagiosFactory
 from exceptions import NagiosSyntaxError
+from stats import stats
 import model
 
 import os
+import time
 
 class NagFile(object):
     """
@@ -42,17 +44,28 @@ class NagFile(object):
         Parse lines and return list of kw (it also has obj_type which should be
         removed when creating object)
         """
+        # checked once, stats may be enabled while parsing
+        enabled = stats.enabled
+        t = time.time()
         f = open(self.filename)
+        try:
+            buf = f.read()
+        finally:
+            f.close()
+        if enabled:
+            t1 = time.time()
+            stats.observe('nagdata_file_read', t1 - t, file=self.filename)
         try:
             if add_file_info:
-                c = self.parser.parse(f.read(), add_pos=True,
+                c = self.parser.parse(buf, add_pos=True,
                         add_attrs={'__filename': self.filename})
             else:
-                c = self.parser.parse(f.read())
+                c = self.parser.parse(buf)
         except NagiosSyntaxError, e:
-            f.close()
             raise NagiosSyntaxError("File \"%s\": %s" % (self.filename, str(e)))
-        f.close()
+        if enabled:
+            stats.observe('nagdata_file_parse', time.time() - t1,
+                    file=self.filename)
         return c
 
 class NagObjectFile(NagFile):
@@ -95,12 +108,13 @@ class NagLogFile(NagFile):
         fd = os.open(self.filename, os.O_RDONLY)
         if pos:
             os.lseek(fd, pos, 0)
-        s = os.read(fd, 4096)
-        buf = ''
+        chunks = []
+        s = os.read(fd, 65536)
         while s:
-            buf += s
-            s = os.read(fd, 4096)
-        pos = len(buf)
+            chunks.append(s)
+            s = os.read(fd, 65536)
+        buf = ''.join(chunks)
+        pos = (pos or 0) + len(buf)
         try:
             if add_file_info:
                 c = self.parser.parse(buf, add_pos=True,
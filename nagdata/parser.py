@@ -23,10 +23,12 @@ Parser of Nagios status and object definitions
 from collection import NagCollection
 from factory import NagiosFactory
 from exceptions import NagiosSyntaxError
+from stats import stats
 import cparser_fmt
 import cparser_fast
 
 import re
+import time
 
 class NagiosParser(object):
     """
@@ -56,10 +58,18 @@ class NagiosParser(object):
         Returns NagCollection of objects
         """
         c = NagCollection(notags=True)
+        # checked once, stats may be enabled while parsing
+        enabled = stats.enabled
+        if enabled:
+            t = time.time()
         try:
             l = self.parse_string(buf);
         except Exception, e:
             raise NagiosSyntaxError(str(e))
+        if enabled:
+            t1 = time.time()
+            stats.observe('nagdata_tokenize', t1 - t,
+                    parser=self.__class__.__name__)
         n = 0
         for elem_type, obj_type, args, fmt in l:
             o = self.factory.from_parse(obj_type, args, fmt)
@@ -71,6 +81,14 @@ class NagiosParser(object):
                     for k, v in add_attrs.items():
                         o[k] = v
                 c.add(o)
+        if enabled:
+            stats.observe('nagdata_construct', time.time() - t1,
+                    parser=self.__class__.__name__)
+            counts = {}
+            for elem_type, obj_type, args, fmt in l:
+                counts[obj_type] = counts.get(obj_type, 0) + 1
+            for obj_type, n in counts.items():
+                stats.incr('nagdata_objects_parsed', n, obj_type=obj_type)
         return c
 
 class ObjectParser(NagiosParser):
@@ -0,0 +1,154 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Recursive scanning of Nagios configuration directories
+"""
+
+import os
+import contextlib
+from multiprocessing.pool import ThreadPool
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+class CfgDirScanner(object):
+    """
+    Finds configuration files (*.cfg) in cfg_dir's and all their
+    subdirectories as Nagios does. Listing of every directory is cached and
+    directory is read again only when its mtime changes. Directories of one
+    level of tree and stat of files are processed in thread pool, which helps
+    on network filesystems. Pool lives only during scan and ctimes, so scanner
+    keeps no threads between calls and may be used from several threads.
+    """
+    suffix = '.cfg'
+
+    def __init__(self, threads=4):
+        """
+        threads -- number of threads to stat and read directories in, 1 or
+                   less means do everything in calling thread
+        """
+        self.threads = threads
+        # directory -> (mtime, (dev, ino), files, subdirectories), replaced
+        # whole by scan
+        self._dirs = {}
+
+    @contextlib.contextmanager
+    def _mapper(self):
+        """
+        Context giving function mapping func over args, in thread pool if
+        there is enough work for it. Pool is started on first use and stopped
+        on exit.
+        """
+        pools = []
+        def map_(func, args):
+            if self.threads <= 1 or len(args) <= 1:
+                return map(func, args)
+            if not pools:
+                pools.append(ThreadPool(self.threads))
+            return pools[0].map(func, args)
+        try:
+            yield map_
+        finally:
+            for pool in pools:
+                pool.close()
+                pool.join()
+
+    def _read_dir(self, d):
+        """
+        Return lists of configuration files and subdirectories in d
+        """
+        files, subdirs = [], []
+        if scandir is None:
+            for n in os.listdir(d):
+                if n.startswith('.'):
+                    continue
+                p = os.path.join(d, n)
+                if os.path.isdir(p):
+                    subdirs.append(p)
+                elif n.endswith(self.suffix) and os.path.isfile(p):
+                    files.append(p)
+        else:
+            for e in scandir(d):
+                if e.name.startswith('.'):
+                    continue
+                if e.is_dir():
+                    subdirs.append(e.path)
+                elif e.name.endswith(self.suffix) and e.is_file():
+                    files.append(e.path)
+        return files, subdirs
+
+    def _scan_dir(self, d):
+        """
+        Return (mtime, (dev, ino), files, subdirectories) of directory d or
+        None if it cannot be read
+        """
+        try:
+            st = os.stat(d)
+            cached = self._dirs.get(d)
+            if cached and cached[0] == st.st_mtime:
+                return cached
+            files, subdirs = self._read_dir(d)
+        except OSError:
+            return None
+        return (st.st_mtime, (st.st_dev, st.st_ino), files, subdirs)
+
+    def scan(self, dirs):
+        """
+        Return set of configuration files in dirs and their subdirectories
+        """
+        files = set()
+        dirs_read = {}
+        seen = set()
+        level = list(dirs)
+        with self._mapper() as map_:
+            while level:
+                subdirs = []
+                for d, r in zip(level, map_(self._scan_dir, level)):
+                    # skip unreadable directories and symlink loops
+                    if r is None or r[1] in seen:
+                        continue
+                    seen.add(r[1])
+                    dirs_read[d] = r
+                    files.update(r[2])
+                    subdirs.extend(r[3])
+                level = subdirs
+        self._dirs = dirs_read
+        return files
+
+    def ctimes(self, filenames):
+        """
+        Return dict filename -> ctime (None if file cannot be stat'ed)
+        """
+        filenames = list(filenames)
+        with self._mapper() as map_:
+            return dict(zip(filenames, map_(file_ctime, filenames)))
+
+def file_ctime(filename):
+    """
+    Return ctime of file or None if it cannot be stat'ed
+    """
+    try:
+        return os.stat(filename).st_ctime
+    except OSError:
+        return None
@@ -0,0 +1,266 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Status snapshots shared between processes through memory-mapped file.
+
+One process loads status and publishes it with StatusSnapshotWriter (or
+StatusSnapshotPublisher mixin), other processes query it with StatusSnapshot
+without parsing status file. Snapshot file layout:
+
+    header     -- magic, generation, status ctime, offset and length of
+                  directory
+    objects    -- marshalled structures of objects (see
+                  BaseNagObj.to_structure)
+    tag blobs  -- marshalled dicts value -> list of (offset, length) of
+                  objects, one per tag
+    directory  -- marshalled dict tag -> (offset, length) of its blob
+
+New generation is written to temporary file and renamed over the old one, so
+readers always see complete snapshot and switch to new one atomically.
+"""
+
+import os
+import mmap
+import marshal
+import struct
+
+from factory import NagiosFactory
+from exceptions import NagDataError, NotFound, TooMany
+
+MAGIC = 'NAGSNAP1'
+# magic, generation, status ctime, directory offset, directory length
+HEADER = struct.Struct('<8sQdQQ')
+
+class SnapshotError(NagDataError):
+    """
+    Snapshot file is damaged or has unknown format
+    """
+    pass
+
+def _plain(v):
+    """
+    Convert attribute value to type which may be marshalled
+    """
+    if isinstance(v, (list, tuple)):
+        return [ _plain(x) for x in v ]
+    elif isinstance(v, str):
+        return str(v)
+    else:
+        return v
+
+class StatusSnapshotWriter(object):
+    """
+    Writes snapshots of status collection to file, each snapshot gets next
+    generation number
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.generation = 0
+        try:
+            f = open(path, 'rb')
+            try:
+                h = HEADER.unpack(f.read(HEADER.size))
+                if h[0] == MAGIC:
+                    self.generation = h[1]
+            finally:
+                f.close()
+        except (IOError, struct.error):
+            pass
+
+    def publish(self, collection, ctime=0):
+        """
+        Write snapshot of collection and atomically replace previous one,
+        returns generation of new snapshot
+        """
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        f = open(tmp, 'wb')
+        try:
+            f.write('\0' * HEADER.size)
+            off = HEADER.size
+            refs = {}
+            for o in collection:
+                s = o.to_structure()
+                s['fields'] = dict([ (a, _plain(v))
+                    for a, v in s['fields'].items() ])
+                blob = marshal.dumps(s)
+                f.write(blob)
+                refs[o] = (off, len(blob))
+                off += len(blob)
+            directory = {}
+            for tag, values in collection.tags.items():
+                blob = marshal.dumps(dict([ (_plain(v), [ refs[o] for o in objs ])
+                    for v, objs in values.items() if objs ]))
+                f.write(blob)
+                directory[tag] = (off, len(blob))
+                off += len(blob)
+            blob = marshal.dumps(directory)
+            f.write(blob)
+            self.generation += 1
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, self.generation, ctime, off, len(blob)))
+        finally:
+            f.close()
+        os.rename(tmp, self.path)
+        return self.generation
+
+class StatusSnapshot(object):
+    """
+    Read-only view of status snapshot published by StatusSnapshotWriter.
+    Objects are decoded from mapped file only when queried, tag indexes are
+    decoded on first use in each generation.
+    """
+
+    def __init__(self, path, factory=NagiosFactory, auto_refresh=True):
+        """
+        path         -- snapshot file
+        auto_refresh -- check for new generation on every query
+        """
+        self.path = path
+        self.factory = factory
+        self.auto_refresh = auto_refresh
+        self._mm = None
+        self._file_id = None
+        self.generation = 0
+        self.status_ctime = 0
+        self.refresh()
+
+    def refresh(self):
+        """
+        Switch to newest generation of snapshot if it was published, returns
+        True if switched
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        if (st.st_dev, st.st_ino) == self._file_id:
+            return False
+        f = open(self.path, 'rb')
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            file_id = os.fstat(f.fileno())
+        finally:
+            f.close()
+        magic, gen, ctime, d_off, d_len = HEADER.unpack(mm[:HEADER.size])
+        if magic != MAGIC:
+            mm.close()
+            raise SnapshotError("'%s' is not status snapshot" % self.path)
+        old = self._mm
+        self._mm = mm
+        self._file_id = (file_id.st_dev, file_id.st_ino)
+        self._directory = marshal.loads(mm[d_off:d_off + d_len])
+        self._tags = {}
+        self.generation = gen
+        self.status_ctime = ctime
+        if old is not None:
+            old.close()
+        return True
+
+    def _tag(self, tag):
+        """
+        Return index of tag: value -> list of object references
+        """
+        if not tag in self._tags:
+            if tag in self._directory:
+                off, l = self._directory[tag]
+                self._tags[tag] = marshal.loads(self._mm[off:off + l])
+            else:
+                self._tags[tag] = {}
+        return self._tags[tag]
+
+    def _object(self, ref):
+        off, l = ref
+        return self.factory.from_structure(
+                marshal.loads(self._mm[off:off + l]))
+
+    def filter(self, **tags):
+        """
+        Return set of objects matching given tags
+        """
+        if self.auto_refresh:
+            self.refresh()
+        if self._mm is None:
+            return set()
+        refs = None
+        for k, v in tags.items():
+            r = self._tag(k).get(v, ())
+            refs = set(r) if refs is None else refs.intersection(r)
+            if not refs:
+                return set()
+        return set([ self._object(r) for r in refs ])
+
+    def getall(self, obj_type, **tags):
+        """
+        Get set of all objects with givent type matching given key-value
+        """
+        return self.filter(obj_type=obj_type, **tags)
+
+    def get(self, obj_type, **kw):
+        """
+        Return object of given type matching given key-value, raise NotFound or
+        TooMany exceptions when no objects found or found more than 1 object.
+        """
+        o = self.getall(obj_type, **kw)
+        if not o:
+            raise NotFound("'%s' (%s) not found" % \
+                    (obj_type, ','.join([ "%s='%s'" % (str(n), str(v))
+                        for n, v in kw.items() ])))
+        elif len(o) > 1:
+            raise TooMany("Too many objects '%s' (%s)" % \
+                    (obj_type, ','.join([ "%s='%s'" % (str(n), str(v))
+                        for n, v in kw.items() ])))
+        return o.pop()
+
+    def get_or_none(self, obj_type, **kw):
+        """
+        Return object of given type matching given key-value, returns None when
+        cannot return single object (not found or found >1)
+        """
+        o = self.getall(obj_type, **kw)
+        if len(o) != 1:
+            return None
+        return o.pop()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            self._file_id = None
+
+class StatusSnapshotPublisher(object):
+    """
+    Mixin to NagData with OnUpdateCallbacks which publishes status snapshot
+    after every status update. snapshot_path should be set to snapshot file
+    (better on tmpfs, e.g. /dev/shm)
+    """
+    snapshot_path = None
+    _snapshot_writer = None
+
+    def publish_status(self):
+        """
+        Publish current status collection, returns generation
+        """
+        if self._snapshot_writer is None:
+            self._snapshot_writer = StatusSnapshotWriter(self.snapshot_path)
+        return self._snapshot_writer.publish(self.status, self.status_ctime)
+
+    def after_update_status(self):
+        self.publish_status()
+        super(StatusSnapshotPublisher, self).after_update_status()
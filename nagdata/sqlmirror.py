@@ -0,0 +1,228 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Mirror of configuration and status objects in SQLite database.
+
+Every obj_type gets table named by it with columns __id (primary key),
+__filename and one column per attribute (columns are added when new attribute
+appears). Primary key attributes and tags of object class are indexed. Lists
+are stored in Nagios syntax (e.g. 'router1,router2').
+
+Mirror remembers hash of every row it wrote, so synchronization writes only
+added, changed and removed rows.
+"""
+
+import sqlite3
+
+from factory import NagiosFactory
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+def _column_value(v):
+    """
+    Convert attribute value to value of column
+    """
+    if v is None or isinstance(v, float):
+        return v
+    elif isinstance(v, (int, long)):
+        if -2**63 <= v < 2**63:
+            return v
+        return str(v)
+    elif isinstance(v, unicode):
+        return v
+    return str(v)
+
+class SqliteMirror(object):
+    """
+    SQLite database mirroring collections of objects. Connection may be used
+    from several threads, but calls should be serialized by caller.
+    """
+
+    def __init__(self, path=':memory:', factory=NagiosFactory):
+        """
+        path -- database file
+        """
+        self.path = path
+        self.factory = factory
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.text_factory = str
+        # obj_type -> list of columns
+        self._columns = {}
+        # obj_type -> __id -> (hash of row, __filename)
+        self._rows = {}
+
+    def _table(self, obj_type, attrs):
+        """
+        Create table for obj_type or add missing columns to it, return list of
+        columns
+        """
+        cols = self._columns.get(obj_type)
+        t = _quote(obj_type)
+        if cols is None:
+            cur = self.db.execute('PRAGMA table_info(%s)' % t)
+            cols = self._columns[obj_type] = [ r[1] for r in cur ]
+            # rows of previous run are not known, start with empty table
+            if cols:
+                self.db.execute('DELETE FROM %s' % t)
+            else:
+                self.db.execute('CREATE TABLE %s '
+                        '("__id" INTEGER PRIMARY KEY, "__filename" TEXT)' % t)
+                cols.extend(['__id', '__filename'])
+            self._rows[obj_type] = {}
+        new = [ a for a in attrs if not a in cols ]
+        if new:
+            C = self.factory.obj_types.get(obj_type)
+            indexed = set()
+            if C is not None:
+                pk = C.pkey
+                if isinstance(pk, tuple):
+                    indexed.update(pk)
+                elif pk is not None:
+                    indexed.add(pk)
+                indexed.update(C.tags)
+            for a in new:
+                self.db.execute('ALTER TABLE %s ADD COLUMN %s' % (t, _quote(a)))
+                if a in indexed:
+                    self.db.execute('CREATE INDEX %s ON %s (%s)' % (
+                        _quote('%s__%s' % (obj_type, a)), t, _quote(a)))
+                cols.append(a)
+        return cols
+
+    def _sync(self, objs, obj_types, filename=None):
+        """
+        Make tables of obj_types (only rows of filename if given) contain
+        exactly objs
+        """
+        by_type = {}
+        for o in objs:
+            by_type.setdefault(o.obj_type, []).append(o)
+        for obj_type in set(obj_types) | set(by_type):
+            if not obj_type in self._rows and not obj_type in by_type:
+                continue
+            objs = by_type.get(obj_type, ())
+            attrs = set()
+            for o in objs:
+                attrs.update(o)
+            attrs.discard('obj_type')
+            cols = self._table(obj_type, attrs)
+            known = self._rows[obj_type]
+            seen = set()
+            changed = []
+            for o in objs:
+                row = tuple([ _column_value(o.get(c)) for c in cols ])
+                h = hash(row)
+                i = row[0]
+                seen.add(i)
+                r = known.get(i)
+                if r is None or r[0] != h:
+                    known[i] = (h, row[1])
+                    changed.append(row)
+            removed = [ (i,) for i, r in known.iteritems()
+                    if not i in seen and (filename is None or r[1] == filename) ]
+            t = _quote(obj_type)
+            if changed:
+                self.db.executemany('INSERT OR REPLACE INTO %s (%s) '
+                        'VALUES (%s)' % (t, ','.join(map(_quote, cols)),
+                            ','.join('?' * len(cols))), changed)
+            if removed:
+                self.db.executemany('DELETE FROM %s WHERE "__id" = ?' % t,
+                        removed)
+                for i, in removed:
+                    del known[i]
+        self.db.commit()
+
+    def sync(self, collection, obj_group):
+        """
+        Synchronize tables of object types of obj_group ('config' or
+        'status') with collection
+        """
+        obj_types = [ t for t, C in self.factory.obj_types.items()
+                if C.obj_group == obj_group ]
+        self._sync([ o for o in collection if o.obj_group == obj_group ],
+                obj_types)
+
+    def sync_file(self, collection, filename):
+        """
+        Synchronize rows of objects from configuration file with collection
+        """
+        obj_types = [ t for t, C in self.factory.obj_types.items()
+                if C.obj_group == 'config' ]
+        self._sync([ o for o in collection.filter(__filename=filename)
+            if o.obj_group == 'config' ], obj_types, filename)
+
+    def execute(self, sql, args=()):
+        """
+        Execute query and return list of rows
+        """
+        return self.db.execute(sql, args).fetchall()
+
+    def close(self):
+        self.db.close()
+
+class SqliteMirrorUpdates(object):
+    """
+    Mixin to NagData to keep SQLite mirror (self.mirror) of loaded config and
+    status up to date on every update. Should precede NagData in bases.
+    mirror_path defines database file (in memory by default).
+    """
+    mirror_path = ':memory:'
+    _mirror = None
+
+    @property
+    def mirror(self):
+        if self._mirror is None:
+            self._mirror = SqliteMirror(self.mirror_path, self.factory)
+            self.sync_mirror()
+        return self._mirror
+
+    def sync_mirror(self):
+        """
+        Synchronize mirror with all loaded components
+        """
+        for name in ('config', 'status'):
+            if name in self.__dict__:
+                self.mirror.sync(getattr(self, name), name)
+
+    def _sync_mirror(self, name, filename=None):
+        if self._mirror is None:
+            # creating mirror synchronizes everything
+            self.mirror
+        elif filename is None:
+            self._mirror.sync(getattr(self, name), name)
+        else:
+            self._mirror.sync_file(self.config, filename)
+
+    def replace_config(self, main_cfg, cfg_objs):
+        super(SqliteMirrorUpdates, self).replace_config(main_cfg, cfg_objs)
+        self._sync_mirror('config')
+
+    def replace_main_config(self, cfg):
+        super(SqliteMirrorUpdates, self).replace_main_config(cfg)
+        if 'config' in self.__dict__:
+            self._sync_mirror('config')
+
+    def replace_config_file(self, filename, cfg_objs):
+        super(SqliteMirrorUpdates, self).replace_config_file(filename,
+                cfg_objs)
+        self._sync_mirror('config', filename)
+
+    def replace_status(self, stat, ctime):
+        super(SqliteMirrorUpdates, self).replace_status(stat, ctime)
+        self._sync_mirror('status')
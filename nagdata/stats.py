@@ -0,0 +1,270 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Timings and counters of nagdata internals.
+
+Recording is disabled by default (instrumented code only checks
+stats.enabled then). Enable it and add sinks which receive snapshots on
+flush:
+
+    from nagdata.stats import stats, LoggerSink, PrometheusSink
+    stats.enable()
+    stats.add_sink(LoggerSink())
+    stats.add_sink(PrometheusSink('/var/lib/node_exporter/nagdata.prom'))
+    n.update_status()
+    stats.flush()
+
+Any callable taking snapshot may be a sink. Snapshot is dict with 'timings'
+((name, labels) -> (count, total seconds, max seconds)), 'counters' and
+'gauges' ((name, labels) -> value), labels are sorted tuples of (label,
+value).
+
+Recorded metrics:
+
+    nagdata_phase           -- timings of phases of NagData updates (phase:
+                               read_config, read_status, index, replace,
+                               callbacks)
+    nagdata_file_read       -- reading of file (file)
+    nagdata_file_parse      -- parsing of file into objects (file)
+    nagdata_tokenize        -- parsing of text (parser)
+    nagdata_construct       -- creation of objects from parsed text (parser)
+    nagdata_objects_parsed  -- counter of parsed objects (obj_type)
+    nagdata_filter          -- counter of filter calls on collections (tag
+                               which was filtered first, result: hit, miss)
+    nagdata_objects         -- gauge of objects in collection (collection,
+                               obj_type)
+    nagdata_index_values    -- gauge of distinct values in tag index
+                               (collection, tag)
+    nagdata_index_entries   -- gauge of entries in tag index (collection, tag)
+
+Gauges are set by NagData.record_stats, which is called after every update
+while stats are enabled.
+"""
+
+import os
+import time
+import logging
+import threading
+import contextlib
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+class Stats(object):
+    """
+    Registry of timings, counters and gauges
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sinks = []
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything recorded
+        """
+        # (name, labels) -> [count, total seconds, max seconds]
+        self.timings = {}
+        # (name, labels) -> value
+        self.counters = {}
+        self.gauges = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record duration of operation
+        """
+        key = (name, _labels(labels))
+        self.lock.acquire()
+        try:
+            t = self.timings.get(key)
+            if t is None:
+                self.timings[key] = [1, seconds, seconds]
+            else:
+                t[0] += 1
+                t[1] += seconds
+                if seconds > t[2]:
+                    t[2] = seconds
+        finally:
+            self.lock.release()
+
+    def incr(self, name, n=1, **labels):
+        """
+        Increase counter by n
+        """
+        key = (name, _labels(labels))
+        self.lock.acquire()
+        try:
+            self.counters[key] = self.counters.get(key, 0) + n
+        finally:
+            self.lock.release()
+
+    def gauge(self, name, value, **labels):
+        """
+        Set gauge to value
+        """
+        self.gauges[(name, _labels(labels))] = value
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """
+        Context recording its duration (if enabled)
+        """
+        if not self.enabled:
+            yield
+            return
+        t = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - t, **labels)
+
+    def snapshot(self):
+        """
+        Return copy of recorded values (see module documentation)
+        """
+        self.lock.acquire()
+        try:
+            return {'timings': dict([ (k, tuple(v))
+                        for k, v in self.timings.items() ]),
+                    'counters': dict(self.counters),
+                    'gauges': dict(self.gauges)}
+        finally:
+            self.lock.release()
+
+    def add_sink(self, sink):
+        """
+        Add callable which is called with snapshot on flush
+        """
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def flush(self):
+        """
+        Pass snapshot to every sink, returns snapshot
+        """
+        snap = self.snapshot()
+        for sink in self.sinks:
+            sink(snap)
+        return snap
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join([ '%s="%s"' % (k, str(v).replace('\\', '\\\\')
+        .replace('"', '\\"').replace('\n', '\\n')) for k, v in labels ])
+
+def prometheus_text(snapshot):
+    """
+    Return snapshot in Prometheus text exposition format, timings become
+    summaries <name>_seconds (with _sum, _count) and gauges <name>_seconds_max
+    """
+    lines = []
+    timings = {}
+    for (name, labels), v in snapshot['timings'].items():
+        timings.setdefault(name, []).append((labels, v))
+    for name in sorted(timings):
+        lines.append('# TYPE %s_seconds summary' % name)
+        for labels, (count, total, mx) in sorted(timings[name]):
+            lines.append('%s_seconds_count%s %d' % (name,
+                _format_labels(labels), count))
+            lines.append('%s_seconds_sum%s %r' % (name,
+                _format_labels(labels), total))
+        lines.append('# TYPE %s_seconds_max gauge' % name)
+        for labels, (count, total, mx) in sorted(timings[name]):
+            lines.append('%s_seconds_max%s %r' % (name,
+                _format_labels(labels), mx))
+    for kind, suffix, metrics in (('counter', '_total',
+            snapshot['counters']), ('gauge', '', snapshot['gauges'])):
+        names = {}
+        for (name, labels), v in metrics.items():
+            names.setdefault(name, []).append((labels, v))
+        for name in sorted(names):
+            lines.append('# TYPE %s%s %s' % (name, suffix, kind))
+            for labels, v in sorted(names[name]):
+                lines.append('%s%s%s %r' % (name, suffix,
+                    _format_labels(labels), v))
+    return '\n'.join(lines) + '\n'
+
+class LoggerSink(object):
+    """
+    Sink writing every timing, counter and gauge to logger
+    """
+
+    def __init__(self, logger='nagdata.stats', level=logging.INFO):
+        if isinstance(logger, basestring):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, snapshot):
+        log = self.logger.log
+        for (name, labels), (count, total, mx) in \
+                sorted(snapshot['timings'].items()):
+            log(self.level, '%s%s count=%d total=%.6fs max=%.6fs', name,
+                    _format_labels(labels), count, total, mx)
+        for kind in ('counters', 'gauges'):
+            for (name, labels), v in sorted(snapshot[kind].items()):
+                log(self.level, '%s%s %s', name, _format_labels(labels), v)
+
+class CallbackSink(object):
+    """
+    Sink calling callback(snapshot)
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self, snapshot):
+        self.callback(snapshot)
+
+class PrometheusSink(object):
+    """
+    Sink writing snapshot in Prometheus text format to file (atomically
+    replacing it, e.g. for node_exporter textfile collector) or to file-like
+    object
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, snapshot):
+        text = prometheus_text(snapshot)
+        if not isinstance(self.path, basestring):
+            self.path.write(text)
+            return
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        f = open(tmp, 'w')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+        os.rename(tmp, self.path)
+
+# stats of nagdata, instrumented modules record to it
+stats = Stats()
@@ -0,0 +1,167 @@
+# Copyright 2010 Alexander Duryagin
+#
+# This file is part of NagData.
+#
+# NagData is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NagData is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NagData.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tracing of nagdata internals with spans.
+
+Spans are recorded around update_config, update_config_file, update_status,
+load_config_file, load_status, NagCollection.extend, save and update
+callbacks. Tracing is off until tracer is set, then every span calls
+tracer.start_span(name, attrs) and tracer.end_span(span, attrs):
+
+    from nagdata import trace
+    t = trace.ChromeTracer('/tmp/refresh.json')
+    trace.set_tracer(t)
+    n.update_status()
+    trace.set_tracer(None)
+    t.save()
+
+File written by ChromeTracer may be opened in chrome://tracing (or
+Perfetto) to see nested spans of single refresh as flame graph.
+"""
+
+import os
+import json
+import time
+import threading
+
+# current tracer, None means tracing is off
+_tracer = None
+
+def set_tracer(tracer):
+    """
+    Set tracer receiving spans, None turns tracing off
+    """
+    global _tracer
+    _tracer = tracer
+
+def get_tracer():
+    return _tracer
+
+class Tracer(object):
+    """
+    Interface of tracers
+    """
+
+    def start_span(self, name, attrs):
+        """
+        Called when span starts, returns object passed to end_span
+        """
+        raise NotImplementedError
+
+    def end_span(self, span, attrs):
+        """
+        Called when span ends, attrs may contain attributes known at end
+        (e.g. 'error')
+        """
+        raise NotImplementedError
+
+class _NoSpan(object):
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class _Span(object):
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.span = self.tracer.start_span(self.name, self.attrs)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.tracer.end_span(self.span, {})
+        else:
+            self.tracer.end_span(self.span, {'error': exc_type.__name__})
+        return False
+
+def span(name, **attrs):
+    """
+    Return context recording span (does nothing if tracing is off)
+    """
+    if _tracer is None:
+        return _NO_SPAN
+    return _Span(_tracer, name, attrs)
+
+def traced(name, attrs=None):
+    """
+    Decorator recording span around every call of method, attrs(*args, **kw)
+    returns attributes of span
+    """
+    def decorator(func):
+        def wrapper(*args, **kw):
+            if _tracer is None:
+                return func(*args, **kw)
+            with _Span(_tracer, name, attrs and attrs(*args, **kw) or {}):
+                return func(*args, **kw)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+class ChromeTracer(Tracer):
+    """
+    Tracer collecting spans as Chrome trace events (complete events, 'X')
+    and saving them to JSON file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def start_span(self, name, attrs):
+        return (name, time.time(), attrs)
+
+    def end_span(self, span, attrs):
+        name, start, start_attrs = span
+        end = time.time()
+        args = dict(start_attrs)
+        args.update(attrs)
+        event = {'name': name, 'cat': 'nagdata', 'ph': 'X',
+                'ts': int(start * 1000000), 'dur': int((end - start) * 1000000),
+                'pid': self.pid, 'tid': threading.current_thread().ident,
+                'args': dict([ (k, str(v)) for k, v in args.items() ])}
+        self.lock.acquire()
+        try:
+            self.events.append(event)
+        finally:
+            self.lock.release()
+
+    def save(self, path=None):
+        """
+        Write collected events to file
+        """
+        self.lock.acquire()
+        try:
+            events = list(self.events)
+        finally:
+            self.lock.release()
+        f = open(path or self.path, 'w')
+        try:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        finally:
+            f.close()